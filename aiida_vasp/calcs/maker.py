@@ -385,21 +385,29 @@ class VaspMaker(object):
         return conflict
 
     def _set_default_paws(self):
-        for key in self.elements:
-            if key not in self._paws:
-                if self._paw_def is None:
-                    raise ValueError(
-                        "The 'paw_map' keyword is required. Pre-defined potential "
-                        "mappings are defined in 'aiida.tools.codespecific.vasp.default_paws'."
-                    )
-                try:
-                    paw = self.calc_cls.Paw.load_paw(
-                        family=self._paw_fam, symbol=self._paw_def[key])[0]
-                except KeyError:
-                    raise ValueError(
-                        "The given 'paw_map' does not contain a mapping for element '{}'".
-                        format(key))
-                self._paws[key] = paw
+        """Resolve the PAWs of all elements without one, in a single (cached) lookup"""
+        from aiida.common.exceptions import NotExistent
+        missing = [key for key in self.elements if key not in self._paws]
+        if not missing:
+            return
+        if self._paw_def is None:
+            raise ValueError(
+                "The 'paw_map' keyword is required. Pre-defined potential "
+                "mappings are defined in 'aiida.tools.codespecific.vasp.default_paws'."
+            )
+        try:
+            symbols = {key: self._paw_def[key] for key in missing}
+        except KeyError as err:
+            raise ValueError(
+                "The given 'paw_map' does not contain a mapping for element '{}'".
+                format(err.args[0]))
+        try:
+            paws = self.calc_cls.Paw.get_family_paws(self._paw_fam,
+                                                     symbols.values())
+        except NotExistent as err:
+            raise ValueError(err.message)
+        for key, symbol in symbols.iteritems():
+            self._paws[key] = paws[symbol]
 
     @property
     def elements(self):
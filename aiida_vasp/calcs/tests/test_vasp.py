@@ -97,6 +97,26 @@ def test_write_wavecar(fresh_aiida_env, vasp_calc_and_ref, vasp_wavecar):
             assert result_wavecar_fo.read() == ref_wavecar
 
 
+@ONLY_ONE_CALC
+def test_write_compressed_wavecar(fresh_aiida_env, vasp_calc_and_ref,
+                                  vasp_wavecar):
+    """Test that a compressed WAVECAR is written decompressed"""
+    from aiida.orm import DataFactory
+    from aiida_vasp.backendtests.common import subpath
+    vasp_calc, _ = vasp_calc_and_ref
+    _, ref_wavecar = vasp_wavecar
+    wavecar = DataFactory('vasp.wavefun')()
+    wavecar.set_file(subpath('data', 'WAVECAR'), compression='gzip', level=1)
+    assert wavecar.compression == 'gzip'
+    assert wavecar.get_file_abs_path().endswith('WAVECAR.gz')
+    vasp_calc.use_wavefunctions(wavecar)
+    inp = vasp_calc.get_inputs_dict()
+    with managed_temp_file() as temp_file:
+        vasp_calc.write_wavecar(inp, temp_file)
+        with open(temp_file, 'r') as result_wavecar_fo:
+            assert result_wavecar_fo.read() == ref_wavecar
+
+
 # pylint: disable=protected-access
 def test_prepare(vasp_nscf_and_ref):
     """Check that preparing creates all necessary files"""
@@ -110,6 +130,7 @@ def test_prepare(vasp_nscf_and_ref):
     }
     assert 'EIGENVAL' in calc_info.retrieve_list
     assert 'DOSCAR' in calc_info.retrieve_list
+    assert 'OSZICAR' in calc_info.retrieve_list
     assert ('wannier90*', '.', 0) in calc_info.retrieve_list
 
     vasp_calc.inp.parameters.update_dict({'icharg': 2})
@@ -120,6 +141,150 @@ def test_prepare(vasp_nscf_and_ref):
     assert set(inputs) == {'INCAR', 'KPOINTS', 'POSCAR', 'POTCAR', 'WAVECAR'}
 
 
+@ONLY_ONE_CALC
+def test_prepare_restart_file_staging(vasp_nscf_and_ref):
+    """Without a parent remote folder, remote staging falls back to linking"""
+    from aiida.orm import DataFactory
+    vasp_calc, reference = vasp_nscf_and_ref
+    vasp_calc.use_settings(
+        DataFactory('parameter')(dict={
+            'RESTART_FILE_STAGING': 'remote_copy'
+        }))
+    inp = vasp_calc.get_inputs_dict()
+    with SandboxFolder() as sandbox_f:
+        calc_info = vasp_calc._prepare_for_submission(sandbox_f, inp)
+        with open(sandbox_f.get_abs_path('WAVECAR')) as wavecar:
+            assert wavecar.read() == reference['wavecar']
+    assert not calc_info.remote_copy_list
+
+    inp['settings'].update_dict({'RESTART_FILE_STAGING': 'ftp'})
+    with SandboxFolder() as sandbox_f:
+        with pytest.raises(ValidationError):
+            vasp_calc._prepare_for_submission(sandbox_f, inp)
+
+
+@ONLY_ONE_CALC
+def test_prepare_remote_symlink(vasp_nscf_and_ref):
+    """Restart files are only symlinked if VASP does not overwrite them"""
+    from aiida.orm import DataFactory
+    vasp_calc, _ = vasp_nscf_and_ref
+    vasp_calc.use_settings(
+        DataFactory('parameter')(dict={
+            'RESTART_FILE_STAGING': 'remote_symlink'
+        }))
+    remote_files = {
+        'CHGCAR': ('computer-uuid', '/parent/CHGCAR'),
+        'WAVECAR': ('computer-uuid', '/parent/WAVECAR')
+    }
+    vasp_calc._remote_restart_files = lambda inputdict: remote_files
+
+    vasp_calc.inp.parameters.update_dict({'lcharg': '.FALSE.'})
+    inp = vasp_calc.get_inputs_dict()
+    with SandboxFolder() as sandbox_f:
+        calc_info = vasp_calc._prepare_for_submission(sandbox_f, inp)
+    assert calc_info.remote_symlink_list == [('computer-uuid',
+                                              '/parent/CHGCAR', 'CHGCAR')]
+    assert calc_info.remote_copy_list == [('computer-uuid', '/parent/WAVECAR',
+                                           'WAVECAR')]
+
+    vasp_calc.inp.parameters.update_dict({'lcharg': True})
+    inp = vasp_calc.get_inputs_dict()
+    with SandboxFolder() as sandbox_f:
+        calc_info = vasp_calc._prepare_for_submission(sandbox_f, inp)
+    assert not calc_info.remote_symlink_list
+    assert [i[2] for i in calc_info.remote_copy_list] == ['CHGCAR', 'WAVECAR']
+
+    vasp_calc.inp.parameters.update_dict({'lcharg': False, 'lwave': 'F'})
+    inp = vasp_calc.get_inputs_dict()
+    with SandboxFolder() as sandbox_f:
+        calc_info = vasp_calc._prepare_for_submission(sandbox_f, inp)
+    assert [i[2] for i in calc_info.remote_symlink_list
+            ] == ['CHGCAR', 'WAVECAR']
+    assert not calc_info.remote_copy_list
+
+
+@ONLY_ONE_CALC
+def test_restart_file_dedup(fresh_aiida_env, vasp_nscf_and_ref, vasp_wavecar):
+    """A WAVECAR identical to a stored one shares its files"""
+    vasp_calc, _ = vasp_nscf_and_ref
+    wavecar, ref_wavecar = vasp_wavecar
+    wavecar.store()
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    node = parser.get_restart_file_node('vasp.wavefun',
+                                        wavecar.get_file_abs_path())
+    assert node.uuid != wavecar.uuid
+    assert node.get_attr('md5') == wavecar.get_attr('md5')
+    with open(node.get_file_abs_path()) as node_file:
+        assert node_file.read() == ref_wavecar
+
+
+def write_chgcar(tmpdir):
+    """Write a CHGCAR with a 2 x 2 x 2 density grid, return its path"""
+    chgcar_path = str(tmpdir.join('CHGCAR'))
+    with open(chgcar_path, 'w') as chgcar_file:
+        chgcar_file.write('GaAs\n 1.0\n 5.65 0.0 0.0\n 0.0 5.65 0.0\n'
+                          ' 0.0 0.0 5.65\n Ga As\n 1 1\nDirect\n'
+                          ' 0.0 0.0 0.0\n 0.25 0.25 0.25\n\n 2 2 2\n'
+                          ' 1.0 2.0 3.0 4.0 5.0\n 6.0 7.0 8.0\n')
+    return chgcar_path
+
+
+@ONLY_ONE_CALC
+def test_chgcar_convert_grids(fresh_aiida_env, vasp_nscf_and_ref, tmpdir):
+    """The CHGCAR grids are only stored as .npy files if the parser setting asks for it"""
+    from aiida.orm import DataFactory
+    vasp_calc, _ = vasp_nscf_and_ref
+    chgcar_path = write_chgcar(tmpdir)
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    parser.get_file = lambda name: chgcar_path
+    node = parser.get_chgcar()
+    node.store()
+    assert not node.get_attr('grids_converted')
+    assert 'density.npy' not in node.get_folder_list()
+    assert node.get_grid().reshape(-1, order='F').tolist() == range(1, 9)
+
+    vasp_calc.use_settings(
+        DataFactory('parameter')(dict={
+            'vasp_parser': {
+                'chgcar_convert_grids': True,
+                'restart_file_dedup': False
+            }
+        }))
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    parser.get_file = lambda name: chgcar_path
+    node = parser.get_chgcar()
+    node.store()
+    assert node.get_attr('grids_converted')
+    assert 'density.npy' in node.get_folder_list()
+    assert node.get_grid().reshape(-1, order='F').tolist() == range(1, 9)
+
+
+@ONLY_ONE_CALC
+def test_restart_file_dedup_chgcar(fresh_aiida_env, vasp_nscf_and_ref,
+                                   tmpdir):
+    """Storing a CHGCAR sharing the files of a stored one leaves them untouched"""
+    from aiida.orm import DataFactory
+    vasp_calc, _ = vasp_nscf_and_ref
+    chgcar_path = write_chgcar(tmpdir)
+    chgcar = DataFactory('vasp.chargedensity')(
+        file=chgcar_path, convert_grids=True)
+    chgcar.store()
+    grid_path = chgcar.get_abs_path('density.npy')
+    grid_stat = os.stat(grid_path)
+    grid = numpy.array(chgcar.get_grid())
+
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    node = parser.get_restart_file_node('vasp.chargedensity', chgcar_path)
+    node.store()
+    assert node.uuid != chgcar.uuid
+    assert node.get_attr('grids_converted')
+    stat = os.stat(grid_path)
+    assert (stat.st_ino, stat.st_mtime) == (grid_stat.st_ino,
+                                           grid_stat.st_mtime)
+    assert (chgcar.get_grid() == grid).all()
+    assert (node.get_grid() == grid).all()
+
+
 @ONLY_ONE_CALC
 def test_parse_with_retrieved(vasp_nscf_and_ref, ref_retrieved_nscf):
     """Check that parsing is successful and creates the right output links"""
@@ -134,6 +299,74 @@ def test_parse_with_retrieved(vasp_nscf_and_ref, ref_retrieved_nscf):
     assert 'bands' in outputs
     assert 'dos' in outputs
     assert 'results' in outputs
+    assert outputs['outcar'].get_dict()['maximum_memory_kb'] == 95344
+
+
+@ONLY_ONE_CALC
+def test_parse_selected_outputs(vasp_nscf_and_ref, ref_retrieved_nscf):
+    """Check that only the outputs requested in the parser settings are created"""
+    from aiida.orm import DataFactory
+    vasp_calc, _ = vasp_nscf_and_ref
+    vasp_calc.use_settings(
+        DataFactory('parameter')(dict={
+            'vasp_parser': {
+                'outputs': ['results', 'kpoints']
+            }
+        }))
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    success, outputs = parser.parse_with_retrieved({
+        'retrieved':
+        ref_retrieved_nscf
+    })
+    outputs = dict(outputs)
+    assert success
+    assert set(outputs) == {'results', 'kpoints'}
+    assert parser.dcp is None
+
+
+@ONLY_ONE_CALC
+def test_parse_dos_dtype(vasp_nscf_and_ref, ref_retrieved_nscf):
+    """Check that the DOS arrays are stored with the requested float type"""
+    from aiida.orm import DataFactory
+    vasp_calc, _ = vasp_nscf_and_ref
+    vasp_calc.use_settings(
+        DataFactory('parameter')(dict={
+            'vasp_parser': {
+                'outputs': ['dos'],
+                'dos_dtype': 'float32'
+            }
+        }))
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    success, outputs = parser.parse_with_retrieved({
+        'retrieved':
+        ref_retrieved_nscf
+    })
+    dos = dict(outputs)['dos']
+    assert success
+    assert dos.get_array('tdos')['total'].dtype == numpy.float32
+    assert dos.get_array('pdos').shape == parser.vrp.pdos.shape
+
+
+@ONLY_ONE_CALC
+def test_parse_concurrent(vasp_nscf_and_ref, ref_retrieved_nscf):
+    """Check that reading the files in a thread pool gives the same outputs"""
+    from aiida.orm import DataFactory
+    vasp_calc, _ = vasp_nscf_and_ref
+    vasp_calc.use_settings(
+        DataFactory('parameter')(dict={
+            'vasp_parser': {
+                'parse_threads': 4
+            }
+        }))
+    parser = vasp_calc.get_parserclass()(vasp_calc)
+    success, outputs = parser.parse_with_retrieved({
+        'retrieved':
+        ref_retrieved_nscf
+    })
+    outputs = dict(outputs)
+    assert success
+    assert {'bands', 'dos', 'kpoints', 'results'}.issubset(outputs)
+    assert outputs['dos'].get_array('tdos').shape == (1, 301)
 
 
 def test_verify_success(vasp_calc_and_ref):
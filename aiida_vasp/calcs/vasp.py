@@ -2,13 +2,19 @@
 # pylint: disable=abstract-method
 # explanation: pylint wrongly complains about (aiida) Node not implementing query
 """VASP - Calculation: Generic run using pymatgen for file preparation"""
+import os
+import shutil
+
 try:
     from collections import ChainMap
 except ImportError:
     from chainmap import ChainMap
 
 from aiida.orm import DataFactory
+from aiida.common.exceptions import ValidationError
 
+from aiida_vasp.data.compressed import link_or_copy
+from aiida_vasp.utils.io.potcar import PotcarCache, concatenate_potcars
 from .base import VaspCalcBase, Input
 
 PARAMETER_CLS = DataFactory('parameter')
@@ -19,8 +25,20 @@ class VaspCalculation(VaspCalcBase):
     """
     General-purpose VASP calculation.
 
-    By default retrieves only the 'OUTCAR', 'vasprun.xml', 'EIGENVAL', 'DOSCAR' and Wannier90 input / output files,
+    By default retrieves only the 'OUTCAR', 'OSZICAR', 'vasprun.xml', 'EIGENVAL', 'DOSCAR' and Wannier90 input / output files,
     but additional retrieve files can be specified via the 'settings['ADDITIONAL_RETRIEVE_LIST']' input.
+
+    The 'settings['RESTART_FILE_STAGING']' input selects how the CHGCAR and WAVECAR inputs are staged:
+
+    * 'copy' (default): copied from the repository into the upload folder.
+    * 'link': hard linked (or reflinked, or as a last resort copied) into the upload folder.
+    * 'remote_copy', 'remote_symlink': copied or symlinked on the remote computer from the remote folder
+      of the calculation that created the input node, if it ran on the same computer
+      (otherwise 'link' is used). Nothing is uploaded. A file is only symlinked if VASP is told
+      not to write it (LCHARG, LWAVE = .FALSE.), which would overwrite the parent's output,
+      otherwise it is copied (with a warning).
+
+    Files stored compressed are always decompressed, in a stream, into the upload folder.
     """
 
     default_parser = 'vasp.vasp'
@@ -41,8 +59,14 @@ class VaspCalculation(VaspCalcBase):
 
     _DEFAULT_PARAMETERS = {}
     _ALWAYS_RETRIEVE_LIST = [
-        'OUTCAR', 'vasprun.xml', 'EIGENVAL', 'DOSCAR', ('wannier90*', '.', 0)
+        'OUTCAR', 'OSZICAR', 'vasprun.xml', 'EIGENVAL', 'DOSCAR',
+        ('wannier90*', '.', 0)
     ]
+    _RESTART_FILE_STAGING = ['copy', 'link', 'remote_copy', 'remote_symlink']
+    # INCAR tags which, set to .FALSE., keep VASP from writing the restart files
+    _RESTART_FILE_WRITE_TAGS = {'CHGCAR': 'lcharg', 'WAVECAR': 'lwave'}
+    # shared by all calculations in the process
+    _POTCAR_CACHE = PotcarCache()
 
     def _prepare_for_submission(self, tempfolder, inputdict):
         """add EIGENVAL, DOSCAR, and all files starting with wannier90 to
@@ -56,8 +80,34 @@ class VaspCalculation(VaspCalcBase):
             additional_retrieve_list = []
         calcinfo.retrieve_list = list(
             set(self._ALWAYS_RETRIEVE_LIST + additional_retrieve_list))
+        symlink = self._restart_file_staging(inputdict) == 'remote_symlink'
+        symlink_list = []
+        copy_list = []
+        for filename, (computer_uuid, path) in sorted(
+                self._remote_restart_files(inputdict).iteritems()):
+            if symlink and not self._writes_restart_file(filename):
+                symlink_list.append((computer_uuid, path, filename))
+                continue
+            if symlink:
+                self.logger.warning(
+                    'copying %s instead of symlinking it, VASP would overwrite '
+                    'the parent calculation\'s file unless %s = .FALSE.',
+                    filename, self._RESTART_FILE_WRITE_TAGS[filename].upper())
+            copy_list.append((computer_uuid, path, filename))
+        if symlink_list:
+            calcinfo.remote_symlink_list = symlink_list
+        if copy_list:
+            calcinfo.remote_copy_list = copy_list
         return calcinfo
 
+    def _writes_restart_file(self, filename):
+        """Whether VASP will write the CHGCAR or WAVECAR, according to LCHARG or LWAVE (default: True)"""
+        value = self._parameters.get(self._RESTART_FILE_WRITE_TAGS[filename],
+                                     True)
+        if isinstance(value, basestring):
+            return value.strip().strip('.').upper().startswith('T')
+        return bool(value)
+
     def verify_inputs(self, inputdict, *args, **kwargs):
         super(VaspCalculation, self).verify_inputs(inputdict, *args, **kwargs)
         self.check_input(inputdict, 'parameters')
@@ -139,13 +189,48 @@ class VaspCalculation(VaspCalcBase):
     def write_additional(self, tempfolder, inputdict):
         """write CHGAR and WAVECAR files if needed"""
         super(VaspCalculation, self).write_additional(tempfolder, inputdict)
-        if self._need_chgd():
+        remote_files = self._remote_restart_files(inputdict)
+        if self._need_chgd() and 'CHGCAR' not in remote_files:
             chgcar = tempfolder.get_abs_path('CHGCAR')
             self.write_chgcar(inputdict, chgcar)
-        if self._need_wfn():
+        if self._need_wfn() and 'WAVECAR' not in remote_files:
             wavecar = tempfolder.get_abs_path('WAVECAR')
             self.write_wavecar(inputdict, wavecar)
 
+    def _restart_file_staging(self, inputdict):
+        """How to stage CHGCAR and WAVECAR, from settings['RESTART_FILE_STAGING']"""
+        try:
+            staging = inputdict['settings'].get_attr('RESTART_FILE_STAGING')
+        except (KeyError, AttributeError):
+            staging = 'copy'
+        if staging not in self._RESTART_FILE_STAGING:
+            raise ValidationError(
+                'RESTART_FILE_STAGING must be one of {}, not {}'.format(
+                    ', '.join(self._RESTART_FILE_STAGING), staging))
+        return staging
+
+    def _remote_restart_files(self, inputdict):
+        """
+        Find the restart files to stage from a parent calculation's remote folder
+
+        :return: {filename: (computer uuid, absolute remote path)}
+        """
+        if not self._restart_file_staging(inputdict).startswith('remote'):
+            return {}
+        needed = []
+        if self._need_chgd():
+            needed.append(('CHGCAR', 'charge_density'))
+        if self._need_wfn():
+            needed.append(('WAVECAR', 'wavefunctions'))
+        computer = self.get_computer()
+        remote_files = {}
+        for filename, linkname in needed:
+            remote = get_parent_remote(inputdict[linkname])
+            if remote and remote.get_computer().uuid == computer.uuid:
+                remote_files[filename] = (computer.uuid, os.path.join(
+                    remote.get_remote_path(), filename))
+        return remote_files
+
     def write_incar(self, inputdict, dst):  # pylint: disable=unused-argument
         """
         Converts from parameters node (ParameterData) to INCAR format and writes to dst.
@@ -178,22 +263,26 @@ class VaspCalculation(VaspCalcBase):
         """
         Concatenates multiple paw files into a POTCAR
 
+        The concatenation is kept in a cache shared by all calculations in the process,
+        keyed by the md5 sums of the paw files, so submitting many calculations for the
+        same elements only reads the paw files once.
+
         :param inputdict: required by baseclass
         :param dst: absolute path of the file to write to
         """
-        import subprocess32 as sp
-        catcom = ['cat']
-        # ~ structure = inputdict['structure']
-        # ~ structure = self.inp.structure
         # order the symbols according to order given in structure
         if 'elements' not in self.attrs():
             self._prestore()
-        for kind in self.elements:
-            paw = inputdict[self._get_paw_linkname(kind)]
-            catcom.append(paw.get_abs_path('POTCAR'))
-        # cat the pawdata nodes into the file
-        with open(dst, 'w') as potcar_f:
-            sp.check_call(catcom, stdout=potcar_f)
+        paws = [
+            inputdict[self._get_paw_linkname(kind)] for kind in self.elements
+        ]
+        paths = [paw.get_abs_path('POTCAR') for paw in paws]
+        key = tuple(paw.get_attr('md5', None) for paw in paws)
+        with open(dst, 'wb') as potcar_f:
+            if None in key:
+                concatenate_potcars(paths, potcar_f)
+            else:
+                potcar_f.write(self._POTCAR_CACHE.get(key, paths))
 
     def write_kpoints(self, inputdict, dst):  # pylint: disable=unused-argument
         """
@@ -246,13 +335,31 @@ class VaspCalculation(VaspCalcBase):
         with open(dst, 'w') as kpoints:
             kpoints.write(kps)
 
-    def write_chgcar(self, inputdict, dst):  # pylint: disable=unused-argument
-        import shutil
-        shutil.copyfile(self.inp.charge_density.get_file_abs_path(), dst)
+    def write_chgcar(self, inputdict, dst):
+        self._write_restart_file(inputdict, self.inp.charge_density, dst)
 
-    def write_wavecar(self, inputdict, dst):  # pylint: disable=unused-argument
-        import shutil
-        shutil.copyfile(self.inp.wavefunctions.get_file_abs_path(), dst)
+    def write_wavecar(self, inputdict, dst):
+        self._write_restart_file(inputdict, self.inp.wavefunctions, dst)
+
+    def _write_restart_file(self, inputdict, node, dst):
+        """Copy (decompressing it in a stream if needed) or link the file of a restart file node to dst"""
+        if node.compression:
+            node.write_file(dst)
+        elif self._restart_file_staging(inputdict) == 'copy':
+            shutil.copyfile(node.get_file_abs_path(), dst)
+        else:
+            link_or_copy(node.get_file_abs_path(), dst)
+
+
+def get_parent_remote(node):
+    """The remote folder of the calculation that created node, None if there is none"""
+    from aiida.common.links import LinkType
+    from aiida.orm.calculation.job import JobCalculation
+    parents = node.get_inputs(
+        node_type=JobCalculation, link_type=LinkType.CREATE)
+    if not parents:
+        return None
+    return parents[0].get_outputs_dict().get('remote_folder')
 
 
 def ordered_unique_list(in_list):
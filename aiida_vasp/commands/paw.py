@@ -48,6 +48,12 @@ class _Paw(VerdiCommandWithSubcommands, Importable):
             help='do not create the family or upload any '
             ' files, if existing files with matching '
             ' md5 sum are found.')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='number of worker processes hashing and parsing the '
+            ' POTCAR files of large families (default: 1, no workers).')
         parser.add_argument('folder')
         parser.add_argument('group_name')
         parser.add_argument('group_description')
@@ -70,7 +76,8 @@ class _Paw(VerdiCommandWithSubcommands, Importable):
             folder,
             familyname=group_name,
             family_desc=group_description,
-            stop_if_existing=stop_if_existing)
+            stop_if_existing=stop_if_existing,
+            processes=params.processes)
 
         print "POTCAR files found in subfolders: {}. New files uploaded from: {}".format(
             files_found, files_uploaded)
@@ -138,8 +145,8 @@ class _Paw(VerdiCommandWithSubcommands, Importable):
             'to store it and you are not passing a folder which contains it.')
 
     def _import_paw(self, filename, **kwargs):
-        """Import a PAW potential."""
-        from os.path import expanduser
+        """Import a PAW potential, or all the potentials of a concatenated POTCAR file."""
+        from os.path import expanduser, isfile
 
         # ~ parser.add_argument('path', help='path to a file or a folder. '
         # ~ 'file: must be in POTCAR format'
@@ -148,13 +155,20 @@ class _Paw(VerdiCommandWithSubcommands, Importable):
         psctr = kwargs.get('psctr')
         psctr = expanduser(psctr[0]) if psctr else None
         try:
-            node, created = self.dataclass.get_or_create(
-                path, psctr=psctr, store=True)
-            print repr(node)
-            if not created:
-                print 'part of the following families:'
-                for group in node.dbnode.dbgroups.all():
-                    print ' * {}'.format(group.name)
+            if isfile(path) and not psctr:
+                nodes = self.dataclass.get_or_create_from_potcars(
+                    [path], store=True)[0]
+            else:
+                nodes = [
+                    self.dataclass.get_or_create(
+                        path, psctr=psctr, store=True)
+                ]
+            for node, created in nodes:
+                print repr(node)
+                if not created:
+                    print 'part of the following families:'
+                    for group in node.dbnode.dbgroups.all():
+                        print ' * {}'.format(group.name)
         except ValueError as err:
             print err
 
@@ -1,8 +1,144 @@
 """Charge density data node (stores CHGCAR files)"""
 # pylint: disable=abstract-method
 # explanation: pylint wrongly complains about (aiida) Node not implementing query
-from aiida.orm.data.singlefile import SinglefileData
+import os
+import StringIO
+import tempfile
 
+import numpy as np
 
-class ChargedensityData(SinglefileData):
-    pass
+from aiida_vasp.data.compressed import CompressedSinglefileData
+from aiida_vasp.utils.io.chgcar import ChgcarParser
+
+
+class ChargedensityData(CompressedSinglefileData):
+    """
+    Stores a CHGCAR file, its header as attributes and its grids as binary files
+
+    The header (cell, species, counts, positions and grid dimensions) is parsed
+    when the file is set. With ``convert_grids=True``, the density (and magnetization)
+    grids are converted once, when the node is stored, into ``<name>.npy`` files next
+    to the CHGCAR, which :py:meth:`get_grid` memory maps, so slices and reductions only
+    read the part of the grid they need. This takes about as much space again as the
+    CHGCAR, so by default the grids are parsed from the CHGCAR on each access instead.
+    Files that can not be parsed are stored as they are. The CHGCAR itself can be
+    stored compressed (see :py:meth:`set_file`).
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._convert_grids = kwargs.pop('convert_grids', False)
+        super(ChargedensityData, self).__init__(*args, **kwargs)
+
+    def set_file(self, filename, compression=None, level=6, md5=None):
+        super(ChargedensityData, self).set_file(
+            filename, compression=compression, level=level, md5=md5)
+        try:
+            parser = ChgcarParser(filename)
+        except (ValueError, IndexError):
+            return
+        header = parser.header
+        self._set_attr('cell', header['cell'].tolist())
+        self._set_attr('species', header['species'])
+        self._set_attr('counts', header['counts'])
+        self._set_attr('coordinates', header['coordinates'])
+        self._set_attr('positions', header['positions'].tolist())
+        self._set_attr('grid', header['grid'])
+        self._set_attr('grid_names', parser.grid_names)
+        self._set_attr('grids_converted', False)
+
+    @property
+    def cell(self):
+        return self.get_attr('cell', None)
+
+    @property
+    def symbols(self):
+        """The chemical symbol of each atom"""
+        return [
+            symbol
+            for symbol, count in zip(
+                self.get_attr('species', []), self.get_attr('counts', []))
+            for _ in range(count)
+        ]
+
+    @property
+    def positions(self):
+        return self.get_attr('positions', None)
+
+    @property
+    def grid(self):
+        """The grid dimensions (nx, ny, nz)"""
+        return self.get_attr('grid', None)
+
+    @property
+    def grid_names(self):
+        """'density' and, for spin polarized runs, 'magnetization' (or its x, y, z components)"""
+        return self.get_attr('grid_names', [])
+
+    def _convert(self):
+        """Write each grid into a Fortran ordered .npy file, chunk by chunk"""
+        with self.uncompressed_path() as path:
+            self._convert_file(path)
+        self._set_attr('grids_converted', True)
+
+    def _convert_file(self, path):
+        """
+        Write the .npy files into temporary files renamed into place
+
+        The repository files may be hard links shared with another node (see
+        :py:meth:`share_files`), so they are replaced, never written through.
+        """
+        parser = ChgcarParser(path)
+        for name in self.grid_names:
+            filename = name + '.npy'
+            if filename not in self.get_folder_list():
+                self.folder.create_file_from_filelike(StringIO.StringIO(),
+                                                      'path/' + filename)
+            dst = self.get_abs_path(filename)
+            handle, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(dst), prefix='.' + filename)
+            os.close(handle)
+            try:
+                out = np.lib.format.open_memmap(
+                    tmp_path,
+                    mode='w+',
+                    dtype=np.float64,
+                    shape=tuple(self.grid),
+                    fortran_order=True)
+                parser.read_grid(name, out=out)
+                out.flush()
+                del out
+                os.rename(tmp_path, dst)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+
+    def store(self, with_transaction=True):
+        if (self._convert_grids and self.grid_names and not self.is_stored
+                and not self.get_attr('grids_converted', False)):
+            self._convert()
+        return super(ChargedensityData, self).store(with_transaction)
+
+    def get_grid(self, name='density'):
+        """
+        Get a (nx, ny, nz) grid, values are the density times the cell volume as in CHGCAR
+
+        The converted grid is memory mapped (read only), an unconverted one is parsed into memory.
+        """
+        if name not in self.grid_names:
+            raise ValueError('no {} grid, available: {}'.format(
+                name, ', '.join(self.grid_names)))
+        if self.get_attr('grids_converted', False):
+            return np.load(self.get_abs_path(name + '.npy'), mmap_mode='r')
+        with self.uncompressed_path() as path:
+            return ChgcarParser(path).read_grid(name)
+
+    def get_plane(self, axis, index, name='density'):
+        """Get the 2D slice at a grid index along axis (0, 1 or 2)"""
+        return np.array(np.take(self.get_grid(name), index, axis=axis))
+
+    def integrate(self, name='density'):
+        """The grid integrated over the cell (the number of electrons for the density)"""
+        grid = self.get_grid(name)
+        # sum plane by plane to only hold one plane of a memory mapped grid
+        return sum(float(grid[:, :, i].sum())
+                   for i in range(grid.shape[2])) / grid.size
@@ -0,0 +1,117 @@
+# pylint: disable=abstract-method
+# explanation: pylint wrongly complains about (aiida) Node not implementing query
+"""Single file data node which can store its file compressed"""
+import contextlib
+import os
+import shutil
+import tempfile
+import StringIO
+
+from aiida.orm.data.singlefile import SinglefileData
+
+from aiida_vasp.utils.io.cache import file_md5
+from aiida_vasp.utils.io.compression import (compress_file, decompress_file,
+                                             get_codec, open_compressed)
+
+
+class CompressedSinglefileData(SinglefileData):
+    """
+    Stores a single file, optionally compressed (gzip or bz2)
+
+    The file is compressed in a stream, block by block, straight into the repository
+    and read back the same way, so it is never held in memory as a whole.
+
+    The md5 sum of the (uncompressed) contents is stored in the 'md5' attribute, a new node
+    for a file which is already stored can share the stored files (see :py:meth:`share_files`).
+    """
+
+    def set_file(self, filename, compression=None, level=6, md5=None):
+        """
+        Store a file
+
+        :param compression: None (store as it is), 'gzip' or 'bz2'
+        :param level: compression level, 1 (fastest) to 9 (smallest)
+        :param md5: md5 sum of the file, if already known
+        """
+        self._set_attr('md5', md5 or file_md5(filename))
+        if not compression:
+            super(CompressedSinglefileData, self).set_file(filename)
+            self._set_attr('compression', None)
+            return
+        name = os.path.basename(filename) + get_codec(compression)[1]
+        for old_name in self.get_folder_list():
+            self.remove_path(old_name)
+        self.folder.create_file_from_filelike(StringIO.StringIO(),
+                                              'path/' + name)
+        compress_file(filename, self.get_abs_path(name), compression, level)
+        self._set_attr('filename', name)
+        self._set_attr('compression', compression)
+
+    @classmethod
+    def find_by_md5(cls, md5):
+        """A stored node of this type holding a file with the given md5 sum, None if there is none"""
+        return cls.query(dbattributes__key='md5', dbattributes__tval=md5).first()
+
+    def share_files(self, node):
+        """
+        Take over the files (hard linked, if possible) and attributes of another node
+
+        The files of two nodes with the same contents (the same md5 sum) thus only take up
+        space once in the repository and nothing needs to be compressed or converted again.
+        """
+        for old_name in self.get_folder_list():
+            self.remove_path(old_name)
+        for name in node.get_folder_list():
+            self.folder.create_file_from_filelike(StringIO.StringIO(),
+                                                  'path/' + name)
+            link_or_copy(node.get_abs_path(name), self.get_abs_path(name))
+        for key, value in node.get_attrs().iteritems():
+            self._set_attr(key, value)
+
+    @property
+    def compression(self):
+        return self.get_attr('compression', None)
+
+    def open_file(self):
+        """Open the stored file for reading, decompressing it on the fly"""
+        if self.compression:
+            return open_compressed(self.get_file_abs_path(), self.compression)
+        return open(self.get_file_abs_path(), 'rb')
+
+    def write_file(self, dst):
+        """Write the (decompressed) file to dst, block by block"""
+        if self.compression:
+            decompress_file(self.get_file_abs_path(), dst, self.compression)
+        else:
+            shutil.copyfile(self.get_file_abs_path(), dst)
+
+    @contextlib.contextmanager
+    def uncompressed_path(self):
+        """Path to the uncompressed file, a temporary one if it is stored compressed"""
+        if not self.compression:
+            yield self.get_file_abs_path()
+            return
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            self.write_file(path)
+            yield path
+        finally:
+            os.remove(path)
+
+
+def link_or_copy(src, dst):
+    """Hard link src to dst, or reflink it (copy on write), or copy it if neither is possible"""
+    import subprocess32 as sp
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        # falls back to a plain copy by itself if reflinks are not supported
+        sp.check_call(['cp', '--reflink=auto', src, dst])
+    except (OSError, sp.CalledProcessError):
+        shutil.copyfile(src, dst)
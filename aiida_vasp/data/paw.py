@@ -1,19 +1,28 @@
 # pylint: disable=abstract-method
 # explanation: pylint wrongly complains about (aiida) Node not implementing query
 """PAW Pseudopotential data node"""
+import hashlib
 import os
+import threading
+import StringIO
+from multiprocessing import Pool
 
 from aiida.orm import Data
 from aiida.orm.querybuilder import QueryBuilder
 from aiida.common.exceptions import NotExistent, UniquenessError
 from aiida.common.utils import md5_file
 
-from aiida_vasp.utils.io.potcar import PawParser as pcparser
+from aiida_vasp.utils.io.potcar import PawParser as pcparser, iter_datasets
 
 
 class PawData(Data):
     """Holds the files and metadata that make up a VASP PAW format pseudopotential"""
     group_type = 'data.vasp.paw.family'
+    # fewer POTCAR files than this are not worth starting worker processes for
+    _POOL_MIN_FILES = 32
+    # (family, symbol) -> PawData, shared by everything resolving PAWs in this process
+    _family_cache = {}
+    _family_cache_lock = threading.Lock()
 
     @property
     def symbol(self):
@@ -29,10 +38,21 @@ class PawData(Data):
 
     @potcar.setter
     def potcar(self, value):
-        name = 'POTCAR'
-        self.folder.insert_path(value, 'path/' + name)
-        attr_dict = pcparser.parse_potcar(value)
-        self._set_attr('md5', md5_file(value))
+        self._set_potcar(value, *pcparser.scan_potcar(value))
+
+    def _set_potcar(self, path, md5, attr_dict):
+        """Store the POTCAR at path with its (already computed) md5 sum and attributes"""
+        self.folder.insert_path(path, 'path/POTCAR')
+        self._set_potcar_attrs(md5, attr_dict)
+
+    def _set_potcar_data(self, data, md5, attr_dict):
+        """Store the contents of a POTCAR (one dataset of a concatenated one) with its md5 sum and attributes"""
+        self.folder.create_file_from_filelike(
+            StringIO.StringIO(data), 'path/POTCAR')
+        self._set_potcar_attrs(md5, attr_dict)
+
+    def _set_potcar_attrs(self, md5, attr_dict):
+        self._set_attr('md5', md5)
         for key, val in attr_dict.iteritems():
             self._set_attr(key, val)
 
@@ -94,6 +114,7 @@ class PawData(Data):
                                   "with name {}, but it belongs to user {},"
                                   " therefore you cannot modify it".format(
                                       famname, group.user.email))
+        cls.clear_family_cache(famname)
         return group, group_created
 
     @classmethod
@@ -126,9 +147,19 @@ class PawData(Data):
                       familyname=None,
                       family_desc=None,
                       store=True,
-                      stop_if_existing=False):
+                      stop_if_existing=False,
+                      processes=1,
+                      batch_size=100):
         """Import a family from a folder like the ones distributed with VASP,
-        usually named potpaw_XXX"""
+        usually named potpaw_XXX
+
+        With `processes` > 1, the POTCAR files of a large enough family are hashed and parsed
+        by a pool of as many worker processes, existing nodes are looked up with a single query and
+        new nodes are stored in batches of `batch_size`, one transaction per batch.
+
+        :return: (found, uploaded), the names of the subfolders with a POTCAR file
+            (including the ones skipped because they could not be read) and of the
+            ones stored as new nodes"""
         from aiida.common import aiidalogger
 
         ffound = []
@@ -143,7 +174,8 @@ class PawData(Data):
         # Always update description, even if the group already existed
         group.description = family_desc
 
-        paw_list = cls._find_paws(family_path, ffound, group, group_created)
+        paw_list = cls._find_paws(family_path, ffound, group, group_created,
+                                  processes)
 
         if stop_if_existing:
             for pawinfo in paw_list:
@@ -152,17 +184,17 @@ class PawData(Data):
                                      '' + pawinfo[2] + " cannot be added with "
                                      "stop_if_existing")
 
-        for pawinfo in paw_list:
-            paw = pawinfo[0]
-            created = pawinfo[1]
-            path = pawinfo[2]
-            if store:
-                if created:
-                    paw.store_all()
+        if store:
+            new_paws = [pawinfo for pawinfo in paw_list if pawinfo[1]]
+            for start in range(0, len(new_paws), batch_size):
+                batch = new_paws[start:start + batch_size]
+                cls._store_batch([pawinfo[0] for pawinfo in batch])
+                for paw, _, path in batch:
                     aiidalogger.debug("New node %s created for file %s",
                                       paw.uuid, path)
                     fupl.append(path)
-                else:
+            for paw, created, path in paw_list:
+                if not created:
                     aiidalogger.debug("Reusing node %s for file %s", paw.uuid,
                                       path)
 
@@ -171,41 +203,98 @@ class PawData(Data):
                 group.store()
                 aiidalogger.debug("New PAW family goup %s created", group.uuid)
             group.add_nodes(i[0] for i in paw_list)
+            cls.clear_family_cache(familyname)
         else:
             print map(repr, [i[0] for i in paw_list])
 
         return ffound, fupl
 
     @classmethod
-    def _find_paws(cls, family_path, ffound, group, group_created):
+    def _find_paws(cls,
+                   family_path,
+                   ffound,
+                   group,
+                   group_created,
+                   processes=1):
         """Go through a directory containing a family of paws and collect individual pseudopotentials"""
-        paw_list = []
-        for pawf in os.listdir(family_path):
+        from aiida.common import aiidalogger
+        subfolders = []
+        for pawf in sorted(os.listdir(family_path)):
+            subfolder_path = os.path.join(family_path, pawf)
+            if os.path.isfile(os.path.join(subfolder_path, 'POTCAR')):
+                subfolders.append((pawf, subfolder_path))
+        potcars = [os.path.join(path, 'POTCAR') for _, path in subfolders]
+        if processes > 1 and len(potcars) >= cls._POOL_MIN_FILES:
+            pool = Pool(processes)
             try:
-                subfolder_path = os.path.join(family_path, pawf)
-                potcar_path = os.path.join(subfolder_path, 'POTCAR')
-                if os.path.isdir(subfolder_path) and os.path.exists(
-                        potcar_path):
-                    ffound.append(pawf)
-                    paw, paw_created = cls.get_or_create(subfolder_path)
-                    # ~ paw._set_attr('family', famname)
-                    # ~ upload = paw_created
-                    # enforce group-wise uniqueness of symbols
-                    in_group = False
-                    if not group_created:
-                        in_group = bool(
-                            cls.load_paw(
-                                group=group, symbol=paw.symbol, silent=True))
-                    if not in_group:
-                        paw_list.append((paw, paw_created, pawf))
-            except Exception:  # pylint: disable=broad-except
-                import sys
-                err = sys.exc_info()[1]
-                print 'WARNING: skipping ' + os.path.abspath(
-                    os.path.join(family_path, pawf))
-                print '  ' + err.__class__.__name__ + ': ' + err.message
+                scanned = pool.map(_scan_potcar, potcars)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            scanned = map(_scan_potcar, potcars)
+
+        existing = cls._load_by_md5(
+            [md5 for md5, _, error in scanned if not error])
+        # enforce group-wise uniqueness of symbols
+        group_symbols = set() if group_created else cls._group_symbols(group)
+        paw_list = []
+        for (pawf, subfolder_path), (md5, attr_dict, error) in zip(
+                subfolders, scanned):
+            ffound.append(pawf)
+            if error:
+                aiidalogger.warning('skipping %s: %s',
+                                    os.path.abspath(subfolder_path), error)
+                continue
+            paw = existing.get(md5)
+            paw_created = paw is None
+            if paw_created:
+                paw = cls()
+                paw._set_potcar(  # pylint: disable=protected-access
+                    os.path.join(subfolder_path, 'POTCAR'), md5, attr_dict)
+                psctr_path = os.path.join(subfolder_path, 'PSCTR')
+                if os.path.isfile(psctr_path):
+                    paw.psctr = psctr_path
+            if paw.symbol not in group_symbols:
+                paw_list.append((paw, paw_created, pawf))
         return paw_list
 
+    @classmethod
+    def _load_by_md5(cls, md5_list):
+        """Find the stored PAWs with any of the given md5 sums in one query, return {md5: paw}"""
+        if not md5_list:
+            return {}
+        query_builder = QueryBuilder()
+        query_builder.append(
+            cls, filters={'attributes.md5': {
+                'in': list(set(md5_list))
+            }})
+        return {i[0].get_attr('md5'): i[0] for i in query_builder.all()}
+
+    @classmethod
+    def _group_symbols(cls, group):
+        """The symbols of all PAWs in a group, in one query"""
+        from aiida.orm import Group
+        query_builder = QueryBuilder()
+        query_builder.append(Group, filters={'id': group.pk}, tag='group')
+        query_builder.append(
+            cls, member_of='group', project=['attributes.symbol'])
+        return {i[0] for i in query_builder.all()}
+
+    @staticmethod
+    def _store_batch(nodes):
+        """Store nodes, in a single transaction if the backend supports it"""
+        from aiida.backends.settings import BACKEND
+        from aiida.backends.profile import BACKEND_DJANGO
+        if BACKEND == BACKEND_DJANGO:
+            from django.db import transaction
+            with transaction.atomic():
+                for node in nodes:
+                    node.store(with_transaction=False)
+        else:
+            for node in nodes:
+                node.store()
+
     @property
     def xc_type(self):
         return self.get_attr('xc_type')
@@ -233,6 +322,52 @@ class PawData(Data):
             created = True
         return paw, created
 
+    @classmethod
+    def get_or_create_from_potcars(cls, paths, store=False, batch_size=100):
+        """
+        Split POTCAR files, concatenated ones from run directories as well, into their datasets
+        and fetch a node for each dataset from the DB, or create it
+
+        The files are read one dataset at a time and each dataset is hashed, then all of the
+        md5 sums are matched against the stored PAWs in a single query. Only the files with
+        unknown datasets are read a second time, to create the new nodes. Identical datasets,
+        also across files, give the same node.
+
+        :param paths: list of paths to POTCAR files
+        :param store: store the new nodes, `batch_size` in a transaction (see :py:meth:`import_family`)
+        :return: one list of (paw, created) per file, in the order of its datasets
+        """
+        file_md5s = []
+        for path in paths:
+            with open(path, 'rb') as potcar:
+                file_md5s.append([
+                    hashlib.md5(data).hexdigest()
+                    for _, data in iter_datasets(potcar)
+                ])
+        paws = cls._load_by_md5([md5 for i in file_md5s for md5 in i])
+        new_paws = []
+        for path, md5s in zip(paths, file_md5s):
+            if all(md5 in paws for md5 in md5s):
+                continue
+            with open(path, 'rb') as potcar:
+                for header, data in iter_datasets(potcar):
+                    md5 = hashlib.md5(data).hexdigest()
+                    if md5 in paws:
+                        continue
+                    paw = cls()
+                    paw._set_potcar_data(  # pylint: disable=protected-access
+                        data, md5,
+                        pcparser.parse_header(
+                            pcparser.header_kv_list(header), path))
+                    paws[md5] = paw
+                    new_paws.append(paw)
+        if store:
+            for start in range(0, len(new_paws), batch_size):
+                cls._store_batch(new_paws[start:start + batch_size])
+        new_uuids = {paw.uuid for paw in new_paws}
+        return [[(paws[md5], paws[md5].uuid in new_uuids) for md5 in md5s]
+                for md5s in file_md5s]
+
     @classmethod
     def from_potcar(cls, potpath, ctrpath=None):
         """Create a paw data node from a POTCAR file and optionally a PSCTR file"""
@@ -269,6 +404,76 @@ class PawData(Data):
 
         return node_filter
 
+    @classmethod
+    def get_family_paws(cls, family, symbols):
+        """
+        Resolve PAW symbols (as in a paw_map) within a family
+
+        The symbols which are not cached yet are looked up with a single query
+        joining the family group and the symbol attribute. The cache is process-wide and
+        can go stale: it is cleared for families obtained through :py:meth:`import_family`
+        or :py:meth:`get_or_create_famgroup`, but not for changes made by other processes
+        or directly to the group, which need a call to :py:meth:`clear_family_cache`.
+
+        :return: {symbol: PawData}
+        :raises NotExistent: if the family does not exist or lacks one of the symbols
+        """
+        symbols = set(symbols)
+        with cls._family_cache_lock:
+            res = {
+                symbol: cls._family_cache[(family, symbol)]
+                for symbol in symbols if (family, symbol) in cls._family_cache
+            }
+        missing = symbols.difference(res)
+        if missing:
+            found = cls._query_family(family, missing)
+            with cls._family_cache_lock:
+                for symbol, paw in found.iteritems():
+                    cls._family_cache[(family, symbol)] = paw
+            res.update(found)
+            missing = symbols.difference(res)
+        if missing:
+            raise NotExistent('PAW family {} does not exist or has no PAW '
+                              'for {}'.format(family, ', '.join(
+                                  sorted(missing))))
+        return res
+
+    @classmethod
+    def get_family_paw(cls, family, symbol):
+        """Resolve a single PAW symbol within a family, see :py:meth:`get_family_paws`"""
+        return cls.get_family_paws(family, [symbol])[symbol]
+
+    @classmethod
+    def clear_family_cache(cls, family=None):
+        """Forget the resolved PAWs of a family, or of all families"""
+        with cls._family_cache_lock:
+            if family is None:
+                cls._family_cache.clear()
+                return
+            for key in [i for i in cls._family_cache if i[0] == family]:
+                del cls._family_cache[key]
+
+    @classmethod
+    def _query_family(cls, family, symbols):
+        """Find the PAWs with the given symbols in a family in one query, return {symbol: paw}"""
+        from aiida.orm import Group
+        query_builder = QueryBuilder()
+        query_builder.append(
+            Group,
+            filters={'name': family,
+                     'type': cls.group_type},
+            tag='family')
+        query_builder.append(
+            cls,
+            member_of='family',
+            filters={'attributes.symbol': {
+                'in': list(symbols)
+            }})
+        res = {}
+        for (paw, ) in query_builder.all():
+            res.setdefault(paw.symbol, paw)
+        return res
+
     @classmethod
     def load_paw(cls, **kwargs):
         """
@@ -322,3 +527,16 @@ class PawData(Data):
             sym = '<symbol: (unset)>'
         return '<PawData: {s} uuid: {u} (pk: {p})>'.format(
             s=sym, u=self.uuid, p=self.pk)
+
+
+def _scan_potcar(path):
+    """
+    md5 sum and attributes of a POTCAR, for the family import (possibly in a worker process)
+
+    :return: (md5, attributes, None) or (None, None, error message)
+    """
+    try:
+        md5, attr_dict = pcparser.scan_potcar(path)
+        return md5, attr_dict, None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, None, err.__class__.__name__ + ': ' + str(err)
@@ -0,0 +1,115 @@
+"""Unittests for PawData"""
+# pylint: disable=unused-import,redefined-outer-name,unused-argument,unused-wildcard-import,wildcard-import
+import pytest
+from aiida.common.exceptions import NotExistent
+
+from aiida_vasp.utils.fixtures import *
+
+
+def test_get_family_paws(fresh_aiida_env, paws):
+    """Symbols are resolved within a family and cached until the cache is cleared"""
+    from aiida.orm import DataFactory
+    paw_cls = DataFactory('vasp.paw')
+    paw_cls.clear_family_cache()
+    res = paw_cls.get_family_paws('TEST', ['As', 'In_d'])
+    assert res['As'].uuid == paws['As'].uuid
+    assert res['In_d'].uuid == paws['In'].uuid
+    assert ('TEST', 'As') in paw_cls._family_cache  # pylint: disable=protected-access
+    assert paw_cls.get_family_paw('TEST', 'As') is res['As']
+    with pytest.raises(NotExistent):
+        paw_cls.get_family_paws('TEST', ['As', 'Ga'])
+    with pytest.raises(NotExistent):
+        paw_cls.get_family_paw('NOFAMILY', 'As')
+    paw_cls.get_or_create_famgroup('TEST')
+    assert ('TEST', 'As') not in paw_cls._family_cache  # pylint: disable=protected-access
+    paw_cls.get_family_paws('TEST', ['As'])
+    paw_cls.clear_family_cache('TEST')
+    assert not paw_cls._family_cache  # pylint: disable=protected-access
+
+
+def test_get_or_create_from_potcars(fresh_aiida_env, paws, tmpdir):
+    """Datasets of (concatenated) POTCARs reuse stored PAWs and create the missing ones"""
+    from aiida.orm import DataFactory
+    paw_cls = DataFactory('vasp.paw')
+    potcar_in = open(paws['In'].potcar).read()
+    potcar_as = open(paws['As'].potcar).read()
+    potcar_ga = potcar_as.replace('As', 'Ga')
+    run_a = tmpdir.join('POTCAR_a')
+    run_a.write(potcar_in + potcar_as)
+    run_b = tmpdir.join('POTCAR_b')
+    run_b.write(potcar_ga + potcar_as)
+    res = paw_cls.get_or_create_from_potcars(
+        [str(run_a), str(run_b)], store=True)
+    assert [(paw.uuid, created) for paw, created in res[0]] == [
+        (paws['In'].uuid, False), (paws['As'].uuid, False)
+    ]
+    paw_ga, created = res[1][0]
+    assert created
+    assert paw_ga.is_stored
+    assert paw_ga.symbol == 'Ga'
+    assert open(paw_ga.potcar).read() == potcar_ga
+    assert res[1][1][0].uuid == paws['As'].uuid
+    res = paw_cls.get_or_create_from_potcars([str(run_b)])
+    assert [(paw.uuid, created) for paw, created in res[0]] == [
+        (paw_ga.uuid, False), (paws['As'].uuid, False)
+    ]
+
+
+@pytest.fixture()
+def paw_family_dir(tmpdir):
+    """A family folder with six distinct (As_0 ... As_5) POTCARs and an unreadable one"""
+    from aiida_vasp.backendtests.common import subpath
+    with open(subpath('LDA', 'As', 'POTCAR')) as potcar:
+        text = potcar.read()
+    family = tmpdir.mkdir('potpaw_TEST')
+    for i in range(6):
+        family.mkdir('As_{}'.format(i)).join('POTCAR').write(
+            text.replace('PAW As', 'PAW As_{}'.format(i)))
+    family.mkdir('Broken').join('POTCAR').write('not a POTCAR\n')
+    return str(family)
+
+
+def test_import_family_pool(fresh_aiida_env, paw_family_dir, monkeypatch):
+    """A large enough family is scanned by a process pool and stored in batches"""
+    from aiida.orm import DataFactory
+    from aiida_vasp.data import paw as paw_module
+    paw_cls = DataFactory('vasp.paw')
+    pools = []
+    pool_cls = paw_module.Pool
+
+    def spy_pool(processes):
+        pools.append(processes)
+        return pool_cls(processes)
+
+    monkeypatch.setattr(paw_module, 'Pool', spy_pool)
+    monkeypatch.setattr(paw_cls, '_POOL_MIN_FILES', 4)
+    found, uploaded = paw_cls.import_family(
+        paw_family_dir,
+        familyname='POOL',
+        family_desc='pool test',
+        processes=2,
+        batch_size=4)
+    assert pools == [2]
+    assert sorted(found) == ['As_{}'.format(i)
+                             for i in range(6)] + ['Broken']
+    assert sorted(uploaded) == ['As_{}'.format(i) for i in range(6)]
+    paws = paw_cls.get_family_paws('POOL',
+                                   ['As_{}'.format(i) for i in range(6)])
+    assert all(paw.is_stored for paw in paws.values())
+
+
+def test_import_family_reuses_stored(fresh_aiida_env, paw_family_dir):
+    """Importing the same POTCARs again reuses the stored nodes"""
+    from aiida.orm import DataFactory
+    paw_cls = DataFactory('vasp.paw')
+    _, uploaded = paw_cls.import_family(
+        paw_family_dir, familyname='FIRST', family_desc='first')
+    assert len(uploaded) == 6
+    found, uploaded = paw_cls.import_family(
+        paw_family_dir, familyname='SECOND', family_desc='second')
+    assert len(found) == 7
+    assert not uploaded
+    symbols = ['As_{}'.format(i) for i in range(6)]
+    first = paw_cls.get_family_paws('FIRST', symbols)
+    second = paw_cls.get_family_paws('SECOND', symbols)
+    assert all(first[i].uuid == second[i].uuid for i in symbols)
@@ -1,8 +1,65 @@
-"""Charge density data node (stores WAVECAR files)"""
+"""Wavefunction data node (stores WAVECAR files)"""
 # pylint: disable=abstract-method
 # explanation: pylint wrongly complains about (aiida) Node not implementing query
-from aiida.orm.data.singlefile import SinglefileData
+from aiida_vasp.data.compressed import CompressedSinglefileData
+from aiida_vasp.utils.io.wavecar import WavecarParser
 
 
-class WavefunData(SinglefileData):
-    pass
+class WavefunData(CompressedSinglefileData):
+    """
+    Stores a WAVECAR file and its header as attributes
+
+    The header (number of spins, kpoints and bands, cutoff, lattice, precision) is read
+    when the file is set, so it can be checked (for example the band count before a restart)
+    without touching the file. Eigenvalues and the coefficients of single bands are read
+    lazily through the record index of :py:class:`WavecarParser`, which needs the
+    WAVECAR to be stored uncompressed (see :py:meth:`set_file`).
+    Files that can not be parsed are stored as they are.
+    """
+
+    def set_file(self, filename, compression=None, level=6, md5=None):
+        super(WavefunData, self).set_file(
+            filename, compression=compression, level=level, md5=md5)
+        try:
+            header = WavecarParser(filename).header
+        except (ValueError, IOError):
+            return
+        for key in ['n_spins', 'n_kp', 'n_bands', 'encut', 'precision']:
+            self._set_attr(key, header[key])
+        self._set_attr('lattice', header['lattice'].tolist())
+
+    @property
+    def num_spins(self):
+        return self.get_attr('n_spins', None)
+
+    @property
+    def num_kpoints(self):
+        return self.get_attr('n_kp', None)
+
+    @property
+    def num_bands(self):
+        return self.get_attr('n_bands', None)
+
+    @property
+    def encut(self):
+        return self.get_attr('encut', None)
+
+    @property
+    def lattice(self):
+        return self.get_attr('lattice', None)
+
+    def get_parser(self):
+        """A :py:class:`WavecarParser` for the stored file"""
+        if self.compression:
+            raise ValueError(
+                'the WAVECAR is stored compressed, use uncompressed_path()')
+        return WavecarParser(self.get_file_abs_path())
+
+    def get_eigenvalues(self):
+        """(nspin, nkp, nbands) eigenvalues and occupations"""
+        parser = self.get_parser()
+        return parser.eigenvalues, parser.occupations
+
+    def get_coefficients(self, spin, kpoint, band):
+        """Memory map (read only) the plane wave coefficients of a band"""
+        return self.get_parser().coefficients(spin, kpoint, band)
@@ -0,0 +1,219 @@
+"""Unittests for VaspParser"""
+# pylint: disable=unused-import,redefined-outer-name,unused-argument,unused-wildcard-import,wildcard-import
+import os
+
+import numpy
+import pytest
+
+from aiida_vasp.parsers.vasp import VaspParser
+from aiida_vasp.utils.io.doscar import DosParser
+from aiida_vasp.utils.io.vasprun import VasprunParser, VasprunStreamParser
+from aiida_vasp.utils.io.xdatcar import XdatParser
+from aiida_vasp.utils.fixtures import *
+from aiida_vasp.utils.fixtures.calcs import ONLY_ONE_CALC
+
+ENERGIES = [-1.0, 0.0, 1.0]
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+def parser_with_settings(calc, files, **settings):
+    """A VaspParser with the given vasp_parser settings, reading files {name: path}"""
+    from aiida.orm import DataFactory
+    calc.use_settings(DataFactory('parameter')(dict={'vasp_parser': settings}))
+    parser = VaspParser(calc)
+    parser.get_file = files.get
+    return parser
+
+VASPRUN = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<modeling>
+ <calculation>
+  <dos>
+   <i name="efermi">      0.00000000 </i>
+   <total>
+    <array>
+     <dimension dim="1">gridpoints</dimension>
+     <dimension dim="2">spin</dimension>
+     <field>energy</field>
+     <field>total</field>
+     <field>integrated</field>
+     <set>
+{total}
+     </set>
+    </array>
+   </total>
+   <partial>
+    <array>
+     <dimension dim="1">gridpoints</dimension>
+     <dimension dim="2">spin</dimension>
+     <dimension dim="3">ion</dimension>
+     <field>energy</field>
+     <field>  s</field>
+     <field>  p</field>
+     <set>
+{partial}
+     </set>
+    </array>
+   </partial>
+  </dos>
+ </calculation>
+</modeling>
+"""
+
+
+def doscar_value(column, point, ion=None):
+    """A DOSCAR value identifying its column, grid point and ion block (None: total DOS)"""
+    return (0 if ion is None else 100 * (ion + 1)) + 10 * column + point
+
+
+def rows(values):
+    return '\n'.join('       <r> {} </r>'.format(' '.join(
+        '{:.4f}'.format(i) for i in row)) for row in values)
+
+
+@pytest.fixture()
+def spin_dos(tmpdir):
+    """
+    vasprun.xml and DOSCAR of a spin polarized run with two ions and s, p orbitals
+
+    The vasprun.xml DOS values are all zero (so the DOSCAR values are used), except for
+    the p orbital of the second ion, spin down, at the first grid point.
+    """
+    block_header = '      1.00000000     -1.00000000    3      0.00000000      1.00000000'
+    lines = ['   2   2   1   0', '  0.1E+02  0.1E+02  0.1E+02  0.1E+02  0.5E-15',
+             '  1.0E-04', '  CAR ', ' unknown system', block_header]
+    for point, energy in enumerate(ENERGIES):
+        lines.append(' {} '.format(energy) + ' '.join(
+            '{:.4f}'.format(doscar_value(column, point))
+            for column in range(1, 5)))
+    for ion in range(2):
+        lines.append(block_header)
+        for point, energy in enumerate(ENERGIES):
+            lines.append(' {} '.format(energy) + ' '.join(
+                '{:.4f}'.format(doscar_value(column, point, ion))
+                for column in range(1, 5)))
+    doscar = tmpdir.join('DOSCAR')
+    doscar.write('\n'.join(lines) + '\n')
+
+    total = []
+    for spin in range(2):
+        total.append('      <set comment="spin {}">'.format(spin + 1))
+        total.append(rows([[energy, 0., 0.] for energy in ENERGIES]))
+        total.append('      </set>')
+    partial = []
+    for ion in range(2):
+        partial.append('      <set comment="ion {}">'.format(ion + 1))
+        for spin in range(2):
+            partial.append('       <set comment="spin {}">'.format(spin + 1))
+            values = [[energy, 0., 0.] for energy in ENERGIES]
+            if (ion, spin) == (1, 1):
+                values[0][2] = 0.5
+            partial.append(rows(values))
+            partial.append('       </set>')
+        partial.append('      </set>')
+    vasprun = tmpdir.join('vasprun.xml')
+    vasprun.write(
+        VASPRUN.format(total='\n'.join(total), partial='\n'.join(partial)))
+    return VasprunParser(str(vasprun)), DosParser(str(doscar))
+
+
+def test_get_dos_node_spin(aiida_env, spin_dos):
+    """DOSCAR columns (e s^ s_ p^ p_) and (e tot^ tot_ intd^ intd_) go to the right spin"""
+    dosnode = VaspParser.get_dos_node(*spin_dos)
+    pdos = dosnode.get_array('pdos')
+    assert pdos.shape == (2, 2, 3)
+    for ion in range(2):
+        for spin in range(2):
+            for point, energy in enumerate(ENERGIES):
+                values = pdos[ion, spin, point]
+                assert values['energy'] == energy
+                assert values['s'] == doscar_value(1 + spin, point, ion)
+                if (ion, spin, point) == (1, 1, 0):
+                    assert values['p'] == 0.5
+                else:
+                    assert values['p'] == doscar_value(3 + spin, point, ion)
+    tdos = dosnode.get_array('tdos')
+    assert tdos.shape == (2, 3)
+    for spin in range(2):
+        for point, energy in enumerate(ENERGIES):
+            values = tdos[spin, point]
+            assert values['energy'] == energy
+            assert values['total'] == doscar_value(1 + spin, point)
+            assert values['integrated'] == doscar_value(3 + spin, point)
+
+
+@pytest.fixture()
+def md_vasprun_path(tmpdir):
+    """A vasprun.xml with five copies of the ionic step"""
+    with open(data_path('phonondb', 'vasprun.xml')) as vasprun:
+        text = vasprun.read()
+    start = text.index('<calculation>')
+    end = text.index('</calculation>') + len('</calculation>')
+    path = str(tmpdir.join('vasprun.xml'))
+    with open(path, 'w') as md_vasprun:
+        md_vasprun.write(text[:start] + text[start:end] * 5 + text[end:])
+    return path
+
+
+@ONLY_ONE_CALC
+def test_trajectory_vasprun(vasp_nscf_and_ref, md_vasprun_path):
+    """The trajectory node holds every other ionic step of vasprun.xml"""
+    vasp_calc, _ = vasp_nscf_and_ref
+    parser = parser_with_settings(
+        vasp_calc, {'vasprun.xml': md_vasprun_path},
+        outputs=['trajectory'],
+        trajectory_stride=2)
+    parser.vrp = parser.read_run()
+    trajectory = parser.get_trajectory()
+    reference = VasprunStreamParser(
+        md_vasprun_path, step_stride=2).trajectory()
+    assert numpy.all(trajectory.get_stepids() == [0, 2, 4])
+    symbols = trajectory.get_symbols()
+    assert len(symbols) == 104
+    assert symbols[0] == 'P'
+    assert numpy.all(trajectory.get_cells() == reference['basis'])
+    assert numpy.allclose(
+        trajectory.get_positions(),
+        numpy.einsum('sij,sjk->sik', reference['positions'],
+                     reference['basis']))
+    assert trajectory.get_array('forces').shape == (3, 104, 3)
+    assert numpy.all(
+        trajectory.get_array('e_fr_energy') == -459.8761413)
+
+
+@ONLY_ONE_CALC
+def test_trajectory_xdatcar(vasp_nscf_and_ref):
+    """The trajectory node can be built from XDATCAR instead of vasprun.xml"""
+    vasp_calc, _ = vasp_nscf_and_ref
+    xdatcar_path = data_path('phonondb', 'XDATCAR')
+    parser = parser_with_settings(
+        vasp_calc, {'XDATCAR': xdatcar_path},
+        outputs=['trajectory'],
+        trajectory_source='xdatcar')
+    trajectory = parser.get_trajectory()
+    reference = XdatParser(xdatcar_path).read()
+    assert numpy.all(trajectory.get_stepids() == reference['steps'])
+    assert list(trajectory.get_symbols()[:2]) == ['P', 'P']
+    cells = trajectory.get_cells()
+    assert cells.shape == (1, 3, 3)
+    assert cells[0, 2, 2] == 9.043083
+    positions = trajectory.get_positions()
+    assert positions.shape == (1, 104, 3)
+    assert numpy.allclose(positions[0, 0], numpy.dot(
+        [0.37912578, 0.37152236, 0.75], cells[0]))
+
+
+@ONLY_ONE_CALC
+def test_outcar_missing(vasp_nscf_and_ref):
+    """Without an OUTCAR there is no outcar node instead of an error"""
+    vasp_calc, _ = vasp_nscf_and_ref
+    parser = parser_with_settings(vasp_calc, {}, outputs=['outcar'])
+    assert parser.read_outcar() is None
+    assert parser.get_outcar_node() is None
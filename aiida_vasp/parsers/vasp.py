@@ -1,26 +1,113 @@
 #encoding: utf-8
 """AiiDA Parser for a aiida_vasp.VaspCalculation"""
+import os
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 
 from aiida.orm import DataFactory
 
 from aiida_vasp.parsers.base import BaseParser
+from aiida_vasp.utils.io.cache import ArrayCache, file_md5
 from aiida_vasp.utils.io.eigenval import EigParser
-from aiida_vasp.utils.io.vasprun import VasprunParser
+from aiida_vasp.utils.io.vasprun import (VasprunParser, VasprunStreamParser,
+                                         ParseError)
 from aiida_vasp.utils.io.doscar import DosParser
 from aiida_vasp.utils.io.kpoints import KpParser
+from aiida_vasp.utils.io.outcar import OutcarParser
+from aiida_vasp.utils.io.oszicar import OszicarParser
+from aiida_vasp.utils.io.procar import ProcarParser
+from aiida_vasp.utils.io.xdatcar import XdatParser
 
 
 class VaspParser(BaseParser):
     """
     Parses all Vasp calculations.
+
+    Parser options can be passed via the settings input node of the calculation::
+
+        calc.use_settings(DataFactory('parameter')(dict={
+            'vasp_parser': {
+                'outputs': ['results', 'structure'],
+                'vasprun_stream_threshold': 50 * 1024**2
+            }
+        }))
+
+    * ``outputs``: the output nodes to create, any of ``bands``, ``charge_density``,
+      ``dos``, ``kpoints``, ``outcar``, ``oszicar``, ``projections``, ``results``,
+      ``structure``, ``trajectory``, ``wavefunctions`` (default: all but ``trajectory``).
+      Files which are only needed for outputs that are not requested are not read.
+    * ``trajectory_stride``: only keep every n-th ionic step in the trajectory.
+    * ``trajectory_source``: ``vasprun`` (default, with forces, stress and energies)
+      or ``xdatcar`` (positions and cells only, much faster for long MD runs;
+      XDATCAR has to be added to ``ADDITIONAL_RETRIEVE_LIST``).
+    * ``vasprun_salvage``: if True, a truncated vasprun.xml (for example from a job
+      killed at the walltime) is read up to the last finished ionic step instead of
+      failing. The results node then has ``vasprun_partial`` set.
+    * ``vasprun_stream_threshold``: vasprun.xml files larger than this (in bytes)
+      are read with the memory bounded :py:class:`VasprunStreamParser`.
+    * ``dos_dtype``: float type of the stored DOS arrays (``float64`` or ``float32``).
+    * ``array_cache``: if True, parsed arrays are kept in an on disk cache
+      (``vasp_array_cache`` in the AiiDA config folder), shared by all parsers.
+      Parsing the same files again loads the arrays from there.
+    * ``array_cache_size``: size limit of the cache in bytes, least recently used
+      entries are removed beyond it.
+    * ``outcar_final_only``: if True (default), the ``outcar`` node only holds the
+      values of the final ionic step, found by searching from the end of the file.
+      Otherwise the whole OUTCAR is scanned and step counts are added.
+    * ``projections_dtype``, ``projections_ions``, ``projections_orbitals``: float type
+      (default: ``float32``), ion indices and orbital names of the PROCAR projections
+      to keep (default: all). PROCAR has to be added to ``ADDITIONAL_RETRIEVE_LIST``.
+    * ``restart_file_compression``: store the CHGCAR and WAVECAR outputs compressed,
+      ``gzip`` or ``bz2`` (default: None, uncompressed), with the compression level
+      ``restart_file_compression_level`` (1 to 9, default: 6).
+    * ``chgcar_convert_grids``: if True, the grids of the CHGCAR output are also stored as
+      binary ``.npy`` files for fast, memory mapped access (about doubles the space taken,
+      default: False, the grids are parsed from the CHGCAR when needed).
+    * ``restart_file_dedup``: if True (default), a CHGCAR or WAVECAR output identical (by md5 sum)
+      to a stored one, like an unchanged CHGCAR of a non selfconsistent run, gets a node which
+      shares (hard links) the stored files instead of storing another copy.
+    * ``parse_threads``: if larger than 0, the independent output files are read
+      concurrently by this many threads (default: 0, one after another).
     """
 
+    _OUTPUTS = [
+        'bands', 'charge_density', 'dos', 'kpoints', 'outcar', 'oszicar',
+        'projections', 'results', 'structure', 'trajectory', 'wavefunctions'
+    ]
+
+    _DEFAULT_SETTINGS = {
+        'array_cache': False,
+        'array_cache_size': 2 * 1024**3,
+        'chgcar_convert_grids': False,
+        'dos_dtype': 'float64',
+        'outcar_final_only': True,
+        'outputs': [
+            'bands', 'charge_density', 'dos', 'kpoints', 'outcar', 'oszicar',
+            'projections', 'results', 'structure', 'wavefunctions'
+        ],
+        'parse_threads': 0,
+        'projections_dtype': 'float32',
+        'projections_ions': None,
+        'projections_orbitals': None,
+        'restart_file_compression': None,
+        'restart_file_compression_level': 6,
+        'restart_file_dedup': True,
+        'trajectory_source': 'vasprun',
+        'trajectory_stride': 1,
+        'vasprun_salvage': False,
+        'vasprun_stream_threshold': 100 * 1024**2
+    }
+
     def __init__(self, calc):
         super(VaspParser, self).__init__(calc)
         self.out_folder = None
         self.vrp = None
         self.dcp = None
+        self.ocp = None
+        self._settings = None
+        self._array_cache = None
+        self._prefetched = {}
 
     def parse_with_retrieved(self, retrieved):
         self.check_state()
@@ -34,39 +121,116 @@ class VaspParser(BaseParser):
                 'look at the scheduler output for troubleshooting')
             return self.result(success=False)
 
-        self.vrp = self.read_run()
+        if self.settings['parse_threads'] > 0:
+            self.prefetch()
 
-        bands, kpout, structure = self.read_eigenval()
+        self.vrp = self.fetch('vasprun.xml', self.read_run)
 
-        self.dcp = self.read_dos()
-        dosnode = self.get_dos_node(self.vrp, self.dcp)
+        structure = None  # get output structure if not static
+        if self.vrp.is_md or self.vrp.is_relaxation:
+            if self.wants('structure') or (self.vrp.is_md and
+                                           self.wants('bands', 'kpoints')):
+                structure = self.fetch('CONTCAR', self.read_cont)
 
-        if bands:
-            self.set_bands(bands)  # append output nodes
+        bands, kpout = None, None
+        if self.wants('bands', 'kpoints'):
+            bands, kpout = self.read_eigenval(structure)
 
-        if not kpout:
-            kpout = self.read_ibzkpt()
+        if bands and self.wants('bands'):
+            self.set_bands(bands)  # append output nodes
 
-        if kpout:
-            self.set_kpoints(kpout)
+        if self.wants('kpoints'):
+            if not kpout:
+                kpout = self.fetch('IBZKPT', self.read_ibzkpt)
+            if kpout:
+                self.set_kpoints(kpout)
 
-        if structure:
+        if structure and self.wants('structure'):
             self.set_structure(structure)
 
-        if self.vrp:
-            if self.vrp.is_sc:  # add chgcar ouput node if selfconsistent run
-                chgnode = self.get_chgcar()
-                self.set_chgcar(chgnode)
-
-            if self.vrp.is_sc:
+        if self.vrp.is_sc:  # add chgcar ouput node if selfconsistent run
+            if self.wants('charge_density'):
+                self.set_chgcar(self.get_chgcar())
+            if self.wants('wavefunctions'):
                 self.set_wavecar(self.get_wavecar())
 
-        self.add_node('results', self.get_output())
+        if self.wants('oszicar', 'results'):
+            self.ocp = self.fetch('OSZICAR', self.read_oszicar)
+        if self.ocp and self.wants('oszicar'):
+            self.add_node('oszicar', self.get_oszicar_node())
+
+        if self.wants('results'):
+            self.add_node('results', self.get_output())
+
+        if self.wants('outcar'):
+            outcar = self.get_outcar_node()
+            if outcar:
+                self.add_node('outcar', outcar)
+
+        if self.wants('projections'):
+            projections = self.get_projections_node()
+            if projections:
+                self.add_node('projections', projections)
+
+        if self.wants('trajectory'):
+            trajectory = self.get_trajectory()
+            if trajectory:
+                self.add_node('trajectory', trajectory)
+
+        if self.wants('dos'):
+            self.dcp = self.fetch('DOSCAR', self.read_dos)
+            dosnode = self.get_dos_node(
+                self.vrp, self.dcp, dtype=self.settings['dos_dtype'])
+            if dosnode:
+                self.set_dos(dosnode)
+
+        self._prefetched = {}  # files which turned out not to be needed
+        return self.result(success=True)
 
-        if dosnode:
-            self.set_dos(dosnode)
+    def prefetch(self):
+        """
+        Read the output files needed for the requested outputs in a thread pool
 
-        return self.result(success=True)
+        The files are independent of each other and lxml and numpy release the GIL
+        for most of the conversion work. The results are picked up by :py:meth:`fetch`.
+        """
+        readers = {'vasprun.xml': self.read_run}
+        if self.wants('structure', 'bands', 'kpoints'):
+            # only used for MD and relaxation runs, but cheap to read
+            readers['CONTCAR'] = self.read_cont
+        if self.wants('bands', 'kpoints'):
+            readers['EIGENVAL'] = self.parse_eigenval
+        if self.wants('kpoints'):
+            readers['IBZKPT'] = self.read_ibzkpt
+        if self.wants('dos'):
+            readers['DOSCAR'] = self.read_dos
+        if self.wants('outcar'):
+            readers['OUTCAR'] = self.read_outcar
+        if self.wants('oszicar', 'results'):
+            readers['OSZICAR'] = self.read_oszicar
+        if self.wants('projections'):
+            readers['PROCAR'] = self.read_procar
+        if self.wants('trajectory') and not self.wants_vasprun_trajectory():
+            readers['XDATCAR'] = self.read_xdatcar
+        pool = ThreadPool(min(self.settings['parse_threads'], len(readers)))
+        try:
+            results = {
+                fname: pool.apply_async(reader)
+                for fname, reader in readers.iteritems()
+            }
+            self._prefetched = {
+                fname: result.get()
+                for fname, result in results.iteritems()
+            }
+        finally:
+            pool.close()
+            pool.join()
+
+    def fetch(self, fname, reader):
+        """Return the prefetched contents of a file or call reader to read it now"""
+        if fname in self._prefetched:
+            return self._prefetched.pop(fname)
+        return reader()
 
     def read_run(self):
         '''Read vasprun.xml'''
@@ -74,7 +238,129 @@ class VaspParser(BaseParser):
         if not vasprun:
             self.logger.warning('no vasprun.xml found')
             return None
-        return VasprunParser(vasprun)
+        if self.wants_vasprun_trajectory() or os.path.getsize(
+                vasprun) > self.settings['vasprun_stream_threshold']:
+            return self.stream_run(vasprun)
+        try:
+            return VasprunParser(vasprun, cache=self.array_cache)
+        except ParseError:
+            if not self.settings['vasprun_salvage']:
+                raise
+            return self.stream_run(vasprun)
+
+    def stream_run(self, vasprun):
+        '''Read vasprun.xml in one streaming pass, salvage it if requested'''
+        sections = [
+            section for section, outputs in [(
+                'eigenvalues', ['bands', 'kpoints']), ('dos', ['dos'])]
+            if self.wants(*outputs)
+        ]
+        vrp = VasprunStreamParser(
+            vasprun,
+            sections=sections,
+            step_stride=self.settings['trajectory_stride'],
+            salvage=self.settings['vasprun_salvage'])
+        if vrp.partial:
+            self.logger.warning(
+                'vasprun.xml is incomplete, read {} finished ionic steps'.
+                format(vrp.num_steps))
+        return vrp
+
+    @property
+    def settings(self):
+        """The parser settings, read once from the settings input"""
+        if self._settings is None:
+            self._settings = self.get_parser_settings()
+        return self._settings
+
+    def get_parser_settings(self):
+        """
+        Read settings['vasp_parser'], fill in defaults and validate
+
+        :raises ValueError: on unknown settings or outputs
+        """
+        settings = dict(self._DEFAULT_SETTINGS)
+        settings_input = self._calc.get_inputs_dict().get('settings')
+        if settings_input:
+            settings.update(settings_input.get_dict().get('vasp_parser', {}))
+        unknown = set(settings).difference(self._DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError('unknown vasp_parser settings: {}'.format(
+                ', '.join(sorted(unknown))))
+        unknown = set(settings['outputs']).difference(self._OUTPUTS)
+        if unknown:
+            raise ValueError('unknown vasp_parser outputs: {}'.format(
+                ', '.join(sorted(unknown))))
+        if settings['trajectory_source'] not in ['vasprun', 'xdatcar']:
+            raise ValueError('unknown vasp_parser trajectory_source: {}'.format(
+                settings['trajectory_source']))
+        if settings['restart_file_compression'] not in [None, 'gzip', 'bz2']:
+            raise ValueError(
+                'unknown vasp_parser restart_file_compression: {}'.format(
+                    settings['restart_file_compression']))
+        return settings
+
+    @property
+    def array_cache(self):
+        """The on disk cache for parsed arrays, None unless enabled in the settings"""
+        if not self.settings['array_cache']:
+            return None
+        if self._array_cache is None:
+            from aiida.common.setup import AIIDA_CONFIG_FOLDER
+            self._array_cache = ArrayCache(
+                os.path.join(
+                    os.path.expanduser(AIIDA_CONFIG_FOLDER),
+                    'vasp_array_cache'),
+                max_size=self.settings['array_cache_size'])
+        return self._array_cache
+
+    def wants(self, *outputs):
+        """True if any of the given outputs was requested"""
+        return any(output in self.settings['outputs'] for output in outputs)
+
+    def wants_vasprun_trajectory(self):
+        return self.wants('trajectory') and self.settings[
+            'trajectory_source'] == 'vasprun'
+
+    def read_outcar(self):
+        '''Read energies, forces, stress, magnetization, timing and memory from OUTCAR'''
+        outcar = self.get_file('OUTCAR')
+        if not outcar:
+            self.logger.info('no OUTCAR found')
+            return None
+        return OutcarParser(
+            outcar, final_only=self.settings['outcar_final_only'])
+
+    def read_oszicar(self):
+        '''Read the convergence history from OSZICAR'''
+        oszicar = self.get_file('OSZICAR')
+        if not oszicar:
+            self.logger.info('no OSZICAR found')
+            return None
+        return OszicarParser(oszicar)
+
+    def read_procar(self):
+        '''Read the band projections from PROCAR'''
+        procar = self.get_file('PROCAR')
+        if not procar:
+            self.logger.info('no PROCAR found')
+            return None
+        return ProcarParser(
+            procar,
+            ions=self.settings['projections_ions'],
+            orbitals=self.settings['projections_orbitals'],
+            dtype=self.settings['projections_dtype'])
+
+    def read_xdatcar(self):
+        '''Read the configurations from XDATCAR'''
+        xdatcar = self.get_file('XDATCAR')
+        if not xdatcar:
+            self.logger.warning('no XDATCAR found')
+            return None
+        xdp = XdatParser(xdatcar)
+        trajectory = xdp.read(step=self.settings['trajectory_stride'])
+        trajectory['symbols'] = np.array(xdp.symbols)
+        return trajectory
 
     def read_dos(self):
         '''read DOSCAR for more accurate tdos and pdos'''
@@ -82,37 +368,35 @@ class VaspParser(BaseParser):
         if not doscar:
             self.logger.warning('no DOSCAR found')
             return None
-        return DosParser(doscar)
+        return DosParser(doscar, cache=self.array_cache)
 
     @staticmethod
-    def get_dos_node(vrp, dcp):
+    def get_dos_node(vrp, dcp, dtype=np.float64):
         """
         takes VasprunParser and DosParser objects
         and returns a doscar array node
+
+        :param dtype: float type of the stored arrays
         """
-        if not vrp or not dcp:
+        if not vrp or not dcp or vrp.tdos is None:
             return None
         dosnode = DataFactory('array')()
         # vrp.pdos is a numpy array, and thus not directly bool-convertible
         if vrp.pdos.size > 0:
-            pdos = vrp.pdos.copy()
-            for i, name in enumerate(vrp.pdos.dtype.names[1:]):
-                num_spins = vrp.pdos.shape[1]
-                # ~ pdos[name] = dcp[:, :, i+1:i+1+ns].transpose(0,2,1)
-                cur = dcp.pdos[:, :, i + 1:i + 1 + num_spins].transpose(
-                    0, 2, 1)
-                cond = vrp.pdos[name] < 0.1
-                pdos[name] = np.where(cond, cur, vrp.pdos[name])
-            dosnode.set_array('pdos', pdos)
+            num_ions, num_spins, num_dos = vrp.pdos.shape
+            # DOSCAR columns (e s^ s_ (p^ p_) ...) -> [ion, spin, dos, orbital]
+            doscar = dcp.pdos[:, :, 1:].reshape(num_ions, num_dos, -1,
+                                                num_spins).transpose(
+                                                    0, 3, 1, 2)
+            dosnode.set_array('pdos', merge_dos(vrp.pdos, doscar, dtype))
         num_spins = 1
         if dcp.tdos.shape[1] == 5:
             num_spins = 2
-        tdos = vrp.tdos[:num_spins, :].copy()
-        for i, name in enumerate(vrp.tdos.dtype.names[1:]):
-            cur = dcp.tdos[:, i + 1:i + 1 + num_spins].transpose()
-            cond = vrp.tdos[:num_spins, :][name] < 0.1
-            tdos[name] = np.where(cond, cur, vrp.tdos[:num_spins, :][name])
-        dosnode.set_array('tdos', tdos)
+        # DOSCAR columns (e tot^ tot_ intd^ intd_) -> [spin, dos, field]
+        doscar = dcp.tdos[:, 1:].reshape(dcp.tdos.shape[0], -1,
+                                         num_spins).transpose(2, 0, 1)
+        dosnode.set_array('tdos',
+                          merge_dos(vrp.tdos[:num_spins], doscar, dtype))
         return dosnode
 
     def read_cont(self):
@@ -126,29 +410,24 @@ class VaspParser(BaseParser):
         structure.set_ase(read_vasp(cont))
         return structure
 
-    def read_eigenval(self):
+    def read_eigenval(self, structure=None):
         '''
         Create a bands and a kpoints node from values in eigenvalue.
 
+        :param structure: the output structure, used for the cell of MD runs
+
         returns: bsnode, kpout
         - bsnode: BandsData containing eigenvalues from EIGENVAL
                 and occupations from vasprun.xml
         - kpout: KpointsData containing kpoints from EIGENVAL,
-
-        both bsnode as well as kpnode come with cell unset
         '''
-        eig = self.get_file('EIGENVAL')
-        if not eig:
-            self.logger.warning('EIGENVAL not found')
-            return None, None, None
-        _, kpoints, bands = EigParser.parse_eigenval(eig)
+        eigenval = self.fetch('EIGENVAL', self.parse_eigenval)
+        if not eigenval:
+            return None, None
+        _, kpoints, bands = eigenval
         bsnode = DataFactory('array.bands')()
         kpout = DataFactory('array.kpoints')()
 
-        structure = None  # get output structure if not static
-        if self.vrp.is_md or self.vrp.is_relaxation:
-            structure = self.read_cont()
-
         if self.vrp.is_md:  # set cell from input or output structure
             cellst = structure
         else:
@@ -166,7 +445,15 @@ class VaspParser(BaseParser):
         bsnode.set_bands(bands, occupations=self.vrp.occupations)
         kpout.set_kpoints(
             kpoints[:, :3], weights=kpoints[:, 3], cartesian=False)
-        return bsnode, kpout, structure
+        return bsnode, kpout
+
+    def parse_eigenval(self):
+        """Read EIGENVAL, returns (header, kpoints, bands) or None"""
+        eig = self.get_file('EIGENVAL')
+        if not eig:
+            self.logger.warning('EIGENVAL not found')
+            return None
+        return EigParser.parse_eigenval(eig, cache=self.array_cache)
 
     def read_ibzkpt(self):
         """Create a DB Node for the IBZKPT file"""
@@ -185,22 +472,110 @@ class VaspParser(BaseParser):
         chgc = self.get_file('CHGCAR')
         if chgc is None:
             return None
-        chgnode = DataFactory('vasp.chargedensity')()
-        chgnode.set_file(chgc)
-        return chgnode
+        return self.get_restart_file_node(
+            'vasp.chargedensity',
+            chgc,
+            convert_grids=self.settings['chgcar_convert_grids'])
 
     def get_wavecar(self):
         """Create a DB Node for the WAVECAR file"""
         wfn = self.get_file('WAVECAR')
         if wfn is None:
             return None
-        wfnode = DataFactory('vasp.wavefun')()
-        wfnode.set_file(wfn)
-        return wfnode
+        return self.get_restart_file_node('vasp.wavefun', wfn)
+
+    def get_restart_file_node(self, data_type, filename, **kwargs):
+        """
+        Create a node for a CHGCAR or WAVECAR file
+
+        If a node with identical contents is stored already, the new node shares its files
+        instead of storing (compressing, converting) them again.
+
+        :param kwargs: passed on to the node class
+        """
+        node_cls = DataFactory(data_type)
+        node = node_cls(**kwargs)
+        md5 = file_md5(filename)
+        if self.settings['restart_file_dedup']:
+            existing = node_cls.find_by_md5(md5)
+            if existing:
+                node.share_files(existing)
+                return node
+        node.set_file(
+            filename,
+            compression=self.settings['restart_file_compression'],
+            level=self.settings['restart_file_compression_level'],
+            md5=md5)
+        return node
+
+    def get_trajectory(self):
+        """Create a TrajectoryData node from the ionic steps in vasprun.xml or XDATCAR"""
+        if self.wants_vasprun_trajectory():
+            trajectory = self.vrp.trajectory()
+            symbols = np.array(self.vrp.symbols)
+        else:
+            trajectory = self.fetch('XDATCAR', self.read_xdatcar) or {}
+            trajectory['basis'] = trajectory.pop('cells', None)
+            symbols = trajectory.pop('symbols', None)
+        if trajectory.get('positions') is None or trajectory.get(
+                'basis') is None:
+            return None
+        cells = trajectory.pop('basis')
+        # reduced -> cartesian coordinates, with the cell of each step
+        positions = np.einsum('sij,sjk->sik', trajectory.pop('positions'),
+                              cells)
+        trajnode = DataFactory('array.trajectory')()
+        trajnode.set_trajectory(
+            stepids=trajectory.pop('steps'),
+            cells=cells,
+            symbols=symbols,
+            positions=positions)
+        for name, array in trajectory.iteritems():
+            trajnode.set_array(name, array)
+        return trajnode
+
+    def get_projections_node(self):
+        """Create an ArrayData node with the PROCAR projections [spin, kp, band, ion, orbital]"""
+        procar = self.fetch('PROCAR', self.read_procar)
+        if not procar:
+            return None
+        projections = DataFactory('array')()
+        projections.set_array('projections', procar.projections)
+        projections.set_array('energies', procar.energies)
+        projections.set_array('occupations', procar.occupations)
+        projections.set_array('kpoints', procar.kpoints)
+        projections.set_array('weights', procar.weights)
+        projections.set_array('ions', np.array(procar.ions))
+        projections.set_array('orbitals', np.array(procar.orbitals))
+        return projections
+
+    def get_outcar_node(self):
+        """Create a ParameterData node from the values read from OUTCAR"""
+        outcar = self.fetch('OUTCAR', self.read_outcar)
+        if not outcar:
+            return None
+        output = DataFactory('parameter')()
+        output.update_dict(outcar.get_output_dict())
+        return output
+
+    def get_oszicar_node(self):
+        """Create an ArrayData node with the electronic (scf_*) and ionic (ionic_*) steps"""
+        oszicar = DataFactory('array')()
+        for prefix, arrays in [('scf', self.ocp.scf), ('ionic',
+                                                        self.ocp.ionic)]:
+            for name, array in arrays.iteritems():
+                oszicar.set_array('{}_{}'.format(prefix, name), array)
+        return oszicar
 
     def get_output(self):
         output = DataFactory('parameter')()
-        output.update_dict({'efermi': self.vrp.efermi})
+        output.update_dict({
+            'efermi': self.vrp.efermi,
+            'energies': self.vrp.final_energies,
+            'vasprun_partial': self.vrp.partial
+        })
+        if self.ocp:
+            output.update_dict({'convergence': self.ocp.get_summary()})
         return output
 
     def set_bands(self, node):
@@ -222,3 +597,25 @@ class VaspParser(BaseParser):
 
     def set_dos(self, node):
         self.add_node('dos', node)
+
+
+def merge_dos(vasprun_dos, doscar_dos, dtype=np.float64):
+    """
+    Merge a vasprun.xml DOS array with the corresponding DOSCAR values
+
+    Values below 0.1 in vasprun.xml are replaced by the more accurate DOSCAR ones.
+    The merge is done in one operation on a plain float view of the structured array.
+
+    :param vasprun_dos: structured array [..., dos], energy being the first field
+    :param doscar_dos: float array [..., dos, field] without the energy column
+    :param dtype: float type of the result
+    :return: structured array with the fields of vasprun_dos, all of type dtype
+    """
+    names = vasprun_dos.dtype.names
+    vasprun_dos = np.ascontiguousarray(vasprun_dos)
+    plain = vasprun_dos.view(np.float64).reshape(vasprun_dos.shape +
+                                                 (len(names), ))
+    merged = plain.astype(dtype)
+    np.copyto(merged[..., 1:], doscar_dos, where=plain[..., 1:] < 0.1)
+    merged_dtype = np.dtype([(name, dtype) for name in names])
+    return merged.view(merged_dtype).reshape(vasprun_dos.shape)
@@ -0,0 +1,123 @@
+"""
+On disk cache for arrays parsed from VASP output files
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def file_md5(filename, blocksize=2**20):
+    """md5 hex digest of a file's contents, read in blocks"""
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class ArrayCache(object):
+    """
+    Size bounded on disk cache of parsed arrays
+
+    An entry is a directory named after the parser, its version and the md5 sum
+    of the parsed file, holding one .npy file per array. Arrays are loaded memory
+    mapped and read only. Files are written under a temporary name and renamed,
+    so the directory can be shared by all parser instances and processes.
+    When the cache grows beyond max_size, the least recently used entries are removed.
+    The cache size is scanned once and then kept as a running total, the directory
+    is only scanned again when the total exceeds max_size.
+
+    :param path: the cache directory
+    :param max_size: the size limit in bytes
+    """
+
+    def __init__(self, path, max_size=2 * 1024**3):
+        self.path = path
+        self.max_size = max_size
+        self._size = None
+
+    def entry(self, filename, parser, version):
+        """The cache entry of a file read by the given parser version"""
+        name = '{}-{}-{}'.format(parser, version, file_md5(filename))
+        return CacheEntry(self, os.path.join(self.path, name))
+
+    def size(self):
+        """The total size of the cached arrays in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits into max_size"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        self._size = total
+
+    def added(self, nbytes):
+        """Count nbytes written to the cache, evict old entries if it is too large"""
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += nbytes
+        if self._size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        """(last use, size, path) of all entries"""
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(path, fname))
+                    for fname in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:  # removed by another process meanwhile
+                continue
+        return entries
+
+
+class CacheEntry(object):
+    """The arrays cached for one parsed file"""
+
+    def __init__(self, cache, path):
+        self.cache = cache
+        self.path = path
+
+    def get(self, name):
+        """Load a cached array memory mapped, None if it is not cached"""
+        try:
+            array = np.load(self._array_path(name), mmap_mode='r')
+            os.utime(self.path, None)  # mark as recently used
+        except (IOError, OSError, ValueError):
+            return None
+        return array
+
+    def put(self, name, array):
+        """Store an array, then evict old entries if the cache is too large"""
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:  # created by another process meanwhile
+                pass
+        handle, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as tmp_file:
+                np.save(tmp_file, array)
+            nbytes = os.path.getsize(tmp_path)
+            os.rename(tmp_path, self._array_path(name))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self.cache.added(nbytes)
+
+    def _array_path(self, name):
+        return os.path.join(self.path, name + '.npy')
@@ -0,0 +1,154 @@
+"""
+Tools for reading volumetric grids from CHGCAR files
+"""
+import mmap
+
+import numpy as np
+
+from .parser import BaseParser
+from .xdatcar import find_line_end, scale_cell
+
+
+class ChgcarParser(BaseParser):
+    """
+    Read the header and the volumetric grids of a (VASP 5 format) CHGCAR file
+
+    The file is memory mapped and scanned once for the byte offsets of the grids,
+    which are then converted chunk by chunk on demand, so reading a grid into a
+    preallocated (for example memory mapped) array needs no more memory than one chunk.
+
+    The grids are, in this order, the density and the magnetization (ISPIN = 2)
+    or its x, y and z components (non-collinear runs). As in the file, the values are
+    the density times the cell volume, the augmentation occupancies are skipped.
+    """
+
+    GRID_NAMES = {
+        1: ['density'],
+        2: ['density', 'magnetization'],
+        4: [
+            'density', 'magnetization_x', 'magnetization_y',
+            'magnetization_z'
+        ]
+    }
+
+    def __init__(self, filename, chunk_size=2**22):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        with open(filename, 'rb') as chgcar:
+            data = mmap.mmap(chgcar.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.header, pos = self.read_header(data)
+                self.blocks = self.index_grids(data, pos, self.header['grid'])
+            finally:
+                data.close()
+
+    @property
+    def grid_names(self):
+        return self.GRID_NAMES[len(self.blocks)]
+
+    @property
+    def symbols(self):
+        """The chemical symbol of each atom"""
+        return [
+            symbol
+            for symbol, count in zip(self.header['species'],
+                                     self.header['counts'])
+            for _ in range(count)
+        ]
+
+    @classmethod
+    def read_header(cls, data):
+        """
+        Read the structure and the grid dimensions
+
+        :return: dict with 'name', 'cell' (3, 3) (scaled), 'species', 'counts',
+            'coordinates' ('direct' or 'cartesian'), 'positions' (natoms, 3), 'grid' (nx, ny, nz)
+            and the offset of the first grid line
+        """
+        data.seek(0)
+        name = data.readline().strip()
+        scale = cls.line(data, float)
+        cell = np.array([cls.line(data, float) for _ in range(3)])
+        species = data.readline().split()
+        if not species or species[0][0].isdigit():
+            raise ValueError('only the VASP 5 CHGCAR format, '
+                             'with a species line, is supported')
+        counts = cls.line(data, int)
+        if isinstance(counts, int):
+            counts = [counts]
+        coordinates = data.readline().strip()
+        if coordinates[0] in 'sS':  # selective dynamics
+            coordinates = data.readline().strip()
+        coordinates = 'cartesian' if coordinates[0] in 'cCkK' else 'direct'
+        positions = np.array(
+            [cls.line(data, float)[:3] for _ in range(sum(counts))])
+        line = data.readline()
+        while not line.strip():
+            line = data.readline()
+        grid = map(int, line.split())
+        return {
+            'name': name,
+            'cell': scale_cell(cell, scale),
+            'species': species,
+            'counts': counts,
+            'coordinates': coordinates,
+            'positions': positions.reshape(-1, 3),
+            'grid': grid
+        }, data.tell()
+
+    @staticmethod
+    def index_grids(data, pos, grid):
+        """
+        Find the grids, each one being the values after a grid dimensions line
+
+        :return: list of (start, end) byte offsets of the grid values
+        """
+        num_values = np.prod(grid)
+        dims_line = data[data.rfind(b'\n', 0, pos - 1) + 1:pos]
+        blocks = []
+        while pos:
+            first_line = data[pos:data.find(b'\n', pos) + 1]
+            row_length = len(first_line)
+            num_lines = -(-num_values // len(first_line.split()))
+            last_line = pos + (num_lines - 1) * row_length
+            if last_line < len(data) and data[last_line - 1:last_line] == b'\n':
+                end = data.find(b'\n', last_line) + 1
+            else:
+                end = find_line_end(data, pos, num_lines)
+            if end <= 0:
+                raise ValueError('CHGCAR ends inside a grid')
+            blocks.append((pos, end))
+            pos = data.find(b'\n' + dims_line, end - 1)
+            pos = pos + len(dims_line) + 1 if pos != -1 else 0
+        if len(blocks) not in ChgcarParser.GRID_NAMES:
+            raise ValueError('CHGCAR holds {} grids'.format(len(blocks)))
+        return blocks
+
+    def read_grid(self, name='density', out=None):
+        """
+        Read a grid, chunk by chunk
+
+        :param out: (nx, ny, nz) array to fill, Fortran ordered (as the file) to avoid a copy
+        :return: (nx, ny, nz) array, x being the fastest running index in the file
+        """
+        start, end = self.blocks[self.grid_names.index(name)]
+        if out is None:
+            out = np.empty(self.header['grid'], order='F')
+        values = out.reshape(-1, order='F')
+        with open(self.filename, 'rb') as chgcar:
+            data = mmap.mmap(chgcar.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos, count = start, 0
+                while pos < end:
+                    stop = data.find(b'\n', min(pos + self.chunk_size, end - 1))
+                    chunk = np.fromstring(data[pos:stop + 1], sep=' ')
+                    values[count:count + chunk.size] = chunk
+                    pos, count = stop + 1, count + chunk.size
+            finally:
+                data.close()
+        if count != values.size:
+            raise ValueError('the {} grid holds {} values, expected {}'.format(
+                name, count, values.size))
+        if not np.may_share_memory(values, out):
+            out[...] = values.reshape(out.shape, order='F')
+        return out
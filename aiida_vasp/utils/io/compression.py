@@ -0,0 +1,44 @@
+"""
+Stream (de)compression of large files
+"""
+import bz2
+import gzip
+import shutil
+
+CODECS = {'gzip': (gzip.open, '.gz'), 'bz2': (bz2.BZ2File, '.bz2')}
+BLOCK_SIZE = 2**20
+
+
+def get_codec(compression):
+    """The (open function, file suffix) of a codec, any of :py:data:`CODECS`"""
+    if compression not in CODECS:
+        raise ValueError('unknown compression: {}, use one of {}'.format(
+            compression, ', '.join(sorted(CODECS))))
+    return CODECS[compression]
+
+
+def open_compressed(filename, compression, mode='rb', level=6):
+    open_file, _ = get_codec(compression)
+    if 'w' in mode:
+        return open_file(filename, mode, compresslevel=level)
+    return open_file(filename, mode)
+
+
+def compress_file(src, dst, compression, level=6):
+    """Compress src into dst, block by block"""
+    with open(src, 'rb') as src_file:
+        dst_file = open_compressed(dst, compression, 'wb', level)
+        try:
+            shutil.copyfileobj(src_file, dst_file, BLOCK_SIZE)
+        finally:
+            dst_file.close()
+
+
+def decompress_file(src, dst, compression):
+    """Decompress src into dst, block by block"""
+    src_file = open_compressed(src, compression)
+    try:
+        with open(dst, 'wb') as dst_file:
+            shutil.copyfileobj(src_file, dst_file, BLOCK_SIZE)
+    finally:
+        src_file.close()
@@ -1,4 +1,6 @@
 """DOSCAR (VASP format) utilities"""
+import mmap
+
 import numpy as np
 
 from .parser import BaseParser
@@ -7,43 +9,133 @@ from .parser import BaseParser
 class DosParser(BaseParser):
     """
     parse a DOSCAR file from a vasp run
+
+    The file is scanned once for the byte offsets of the per ion blocks,
+    each block is then converted in one call.
+
+    :keyword ions: indices of the ions to read the partial DOS for (default: all)
+    :keyword lazy: if True, the partial DOS is only read on first access of
+        :py:attr:`pdos`, :py:meth:`get_pdos` can read any subset of ions later on.
+    :keyword cache: optional :py:class:`~aiida_vasp.utils.io.cache.ArrayCache`,
+        the partial DOS of all ions is taken from it if the file was parsed before.
     """
 
+    CACHE_VERSION = 1
+
     def __init__(self, filename, **kwargs):
         self.ispin = kwargs.get('ispin')
         self.lorbit = kwargs.get('lorbit')
         self.rwigs = kwargs.get('rwigs')
-        self.header, self.tdos, self.pdos = self.parse_doscar(filename)
+        self.filename = filename
+        self.ions = kwargs.get('ions')
+        self._pdos = None
+        self._entry = None
+        if kwargs.get('cache'):
+            self._entry = kwargs['cache'].entry(filename, 'doscar',
+                                                self.CACHE_VERSION)
+        self.header, self.tdos, self.blocks = self.index_doscar(filename)
+        if not kwargs.get('lazy'):
+            self._pdos = self.get_pdos(self.ions)
+
+    @property
+    def pdos(self):
+        """The partial DOS, (n_ions, n_dos, n_columns) array or [] if not present"""
+        if self._pdos is None:
+            self._pdos = self.get_pdos(self.ions)
+        return self._pdos
+
+    def get_pdos(self, ions=None):
+        """
+        Read the partial DOS for a subset of ions
+
+        :param ions: list of ion indices (default: all ions)
+        :return: (len(ions), n_dos, n_columns) array, [] if the file has no partial DOS
+        """
+        if not self.blocks:
+            return []
+        if self._entry:
+            return self._get_cached_pdos(ions)
+        return self._read_pdos(ions)
+
+    def _read_pdos(self, ions=None):
+        """Convert the blocks of the given ions"""
+        if ions is None:
+            ions = range(len(self.blocks))
+        with open(self.filename, 'rb') as dos:
+            data = mmap.mmap(dos.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return self.read_blocks(data, [self.blocks[i] for i in ions],
+                                        self.header['n_dos'])
+            finally:
+                data.close()
+
+    def _get_cached_pdos(self, ions=None):
+        """Take the partial DOS from the cache, read and store all ions if missing"""
+        pdos = self._entry.get('pdos')
+        if pdos is None:
+            pdos = self._read_pdos()
+            self._entry.put('pdos', pdos)
+        if ions is None:
+            return pdos
+        return pdos[ions]
+
+    @staticmethod
+    def read_blocks(data, blocks, ndos):
+        """Convert the given (start, end) byte ranges into one contiguous array"""
+        first = data[blocks[0][0]:blocks[0][1]]
+        ncols = len(first[:first.find(b'\n')].split())
+        pdos = np.empty((len(blocks), ndos, ncols))
+        for i, (start, end) in enumerate(blocks):
+            pdos[i] = np.fromstring(data[start:end], sep=' ').reshape(ndos, ncols)
+        return pdos
 
     @classmethod
-    # pylint: disable=too-many-locals
-    def parse_doscar(cls, filename):
+    def parse_doscar(cls, filename, ions=None):
         """Read a VASP DOSCAR file and extract metadata and a density of states data array"""
-        with open(filename) as dos:
-            num_ions, num_atoms, p00, p01 = cls.line(dos, int)
-            line_0 = cls.line(dos, float)
-            line_1 = cls.line(dos, float)
-            coord_type = cls.line(dos)
-            sys = cls.line(dos)
-            line_2 = cls.line(dos, float)
-            emax, emin, ndos, efermi, weight = line_2
-            ndos = int(ndos)
-            raw = cls.splitlines(dos)
-
-        # either (e tot intd) or (e tot^ tot_ intd^ intd_)
-        tdos = np.array(raw[:ndos])
+        parser = cls(filename, ions=ions)
+        return parser.header, parser.tdos, parser.pdos
+
+    @classmethod
+    # pylint: disable=too-many-locals
+    def index_doscar(cls, filename):
+        """
+        Read the header and total DOS of a DOSCAR file and find the per ion blocks
+
+        :return: header, tdos, blocks, blocks being a list of (start, end) byte offsets
+            of the data lines of each ion
+        """
+        with open(filename, 'rb') as dos:
+            data = mmap.mmap(dos.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                num_ions, num_atoms, p00, p01 = cls.line(data, int)
+                line_0 = cls.line(data, float)
+                line_1 = cls.line(data, float)
+                coord_type = cls.line(data)
+                sys = cls.line(data)
+                line_2 = cls.line(data, float)
+                emax, emin, ndos, efermi, weight = line_2
+                ndos = int(ndos)
+                tdos_start = data.tell()
+                for _ in range(ndos):
+                    data.readline()
+                tdos_end = data.tell()
+                # either (e tot intd) or (e tot^ tot_ intd^ intd_)
+                tdos = np.fromstring(data[tdos_start:tdos_end], sep=' ')
+                tdos = tdos.reshape(ndos, -1)
+                blocks = []
+                if data.readline().strip():
+                    blocks = cls.find_blocks(data, tdos_end)
+            finally:
+                data.close()
         # either (e s (p) (d)) -> 10
         # or (e s^ s_ (p^ p_) (d^ d_)) -> 19
         # or (e s[m] (p[m]) (d[m]) -> 37
         # or (e s^[m] s_[m] (p^[m] p_[m]) (d^[m] d_[m]) -> 73
         # probably format later with vasprun or PROCAR info?
         # from vasprun: pdos[i][1+j::n_spin] <-> vrunpdos[i][j][1:]
-        pdos = []
-        if line_2 in raw:
-            for _ in range(num_ions):
-                start = raw.index(line_2) + 1
-                pdos += [raw[start:start + ndos]]
-            pdos = np.array(pdos)
+        if blocks and len(blocks) != num_ions:
+            raise ValueError('DOSCAR contains {} ion blocks for {} ions'.format(
+                len(blocks), num_ions))
 
         header = {}
         header[0] = line_0
@@ -61,4 +153,21 @@ class DosParser(BaseParser):
         header['efermi'] = efermi
         header['weight'] = weight
 
-        return header, tdos, pdos
+        return header, tdos, blocks
+
+    @staticmethod
+    def find_blocks(data, start):
+        """
+        Find the data lines following each repetition of the block header line at start
+
+        :return: list of (start, end) byte offsets, one per block
+        """
+        data.seek(start)
+        block_header = b'\n' + data.readline()
+        starts = []
+        pos = start - 1
+        while pos != -1:
+            starts.append(pos + len(block_header))
+            pos = data.find(block_header, starts[-1] - 1)
+        ends = [i - len(block_header) + 1 for i in starts[1:]] + [len(data)]
+        return zip(starts, ends)
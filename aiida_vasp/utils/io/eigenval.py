@@ -2,8 +2,6 @@
 This module contains tools to read kpoints and bands from EIGENVALUE files.
 """
 
-import re
-
 import numpy as np
 
 from .parser import BaseParser
@@ -15,16 +13,26 @@ class EigParser(BaseParser):
     in EIGENVALUE files
     """
 
-    def __init__(self, filename):
-        res = self.parse_eigenval(filename)
+    CACHE_VERSION = 1
+
+    def __init__(self, filename, cache=None):
+        res = self.parse_eigenval(filename, cache=cache)
         self.header = res[0]
         self.kpoints = res[1]
         self.bands = res[2]
 
     @classmethod
     # pylint: disable=too-many-locals
-    def parse_eigenval(cls, filename):
-        """Parse a VASP EIGENVAL file and extract metadata and a band structure data array"""
+    def parse_eigenval(cls, filename, cache=None):
+        """
+        Parse a VASP EIGENVAL file and extract metadata and a band structure data array
+
+        :param cache: optional :py:class:`~aiida_vasp.utils.io.cache.ArrayCache`,
+            the kpoints and bands arrays are taken from it if the file was parsed before.
+        """
+        entry = None
+        if cache:
+            entry = cache.entry(filename, 'eigenval', cls.CACHE_VERSION)
         with open(filename) as eig:
             line_0 = cls.line(eig, int)  # read header
             line_1 = cls.line(eig, float)  # "
@@ -33,22 +41,16 @@ class EigParser(BaseParser):
             name = cls.line(eig)  # read name line (can be empty)
             param_0, num_kp, num_bands = cls.line(eig,
                                                   int)  # read: ? #kp #bands
-            data = eig.read()  # rest is data
-        num_ions, num_atoms, p00, num_spins = line_0
-        data = re.split(cls.empty_line, data)  # list of data blocks
-        data = [[line.split() for line in block.splitlines()]
-                for block in data]
-        kpoints = np.zeros((num_kp, 4))
-        bands = np.zeros((num_spins, num_kp, num_bands))
-        for k, field in enumerate(data):  # iterate over data blocks
-            kpbs = filter(None, field)  # throw away empty lines
-            kpi = map(float,
-                      kpbs.pop(0))  # first line of block is kpoints -> pop
-            kpoints[k] = kpi
-            for point in kpbs:  # rest are band energies
-                bands[:, k, int(point[0]) - 1] = point[
-                    1:num_spins +
-                    1]  # place energy value in bands[kp, nb] (BandstrucureData format)
+            num_ions, num_atoms, p00, num_spins = line_0
+            kpoints, bands = None, None
+            if entry:
+                kpoints, bands = entry.get('kpoints'), entry.get('bands')
+            if kpoints is None or bands is None:
+                kpoints, bands = cls.parse_body(eig, num_kp, num_bands,
+                                                num_spins)
+                if entry:
+                    entry.put('kpoints', kpoints)
+                    entry.put('bands', bands)
         header = {}  # build header dict
         header[0] = line_0
         header[1] = line_1
@@ -64,3 +66,29 @@ class EigParser(BaseParser):
         header['n_kp'] = num_kp
 
         return header, kpoints, bands
+
+    @staticmethod
+    def parse_body(eig, num_kp, num_bands, num_spins):
+        """
+        Convert the numeric body of an EIGENVAL file in one call
+
+        Each k-point block is a row of 4 k-point values followed by
+        num_bands rows of (index, energies[, occupations]).
+
+        :return: kpoints (num_kp, 4) and bands (num_spins, num_kp, num_bands)
+        """
+        data = np.fromstring(eig.read(), sep=' ')
+        block_size, remainder = divmod(data.size, num_kp)
+        num_cols, col_remainder = divmod(block_size - 4, num_bands)
+        if remainder or col_remainder or num_cols < num_spins + 1:
+            raise ValueError('EIGENVAL data does not match {} kpoints and {} '
+                             'bands'.format(num_kp, num_bands))
+        data = data.reshape(num_kp, block_size)
+        kpoints = data[:, :4].copy()
+        points = data[:, 4:].reshape(num_kp, num_bands, num_cols)
+        band_idx = points[:, :, 0].astype(int) - 1
+        bands = np.zeros((num_spins, num_kp, num_bands))
+        # place energy values in bands[spin, kp, nb] (BandstrucureData format)
+        bands[:, np.arange(num_kp)[:, np.newaxis], band_idx] = points[
+            :, :, 1:num_spins + 1].transpose(2, 0, 1)
+        return kpoints, bands
@@ -0,0 +1,100 @@
+"""
+Tools for parsing OSZICAR files
+"""
+import re
+
+import numpy as np
+
+from .parser import BaseParser
+
+_FLOAT = r'\s+(-?\d*\.?\d+(?:[eE][-+]?\d+)?)'
+
+
+class OszicarParser(BaseParser):
+    """
+    Read the electronic and ionic convergence history from an OSZICAR file
+
+    The lines are classified in one vectorized pass: electronic steps start with
+    the algorithm and a colon (like ``DAV:``), ionic steps contain ``F=``.
+    The electronic steps are then converted in one call, falling back to one line
+    at a time if a line does not match (like an overflowed ``****`` field), which
+    is then filled with nan.
+
+    :py:attr:`scf` holds the electronic step arrays 'n', 'e', 'de', 'deps', 'ncg',
+    'rms', 'rmsc' (nan where not printed) and 'ionic_step', the index of the ionic
+    step each one belongs to. :py:attr:`ionic` holds one array per value of the
+    ionic step lines, named after the OSZICAR keys in lowercase ('f', 'e0', 'de',
+    'mag', for MD runs also 't', 'e', 'ek', 'sp', 'sk').
+    """
+
+    _SCF_LINE = re.compile(r'^\s*\w+:' + _FLOAT * 6 + r'(?:' + _FLOAT + ')?',
+                           re.M)
+    _SCF_FIELDS = ['n', 'e', 'de', 'deps', 'ncg', 'rms', 'rmsc']
+    _IONIC_VALUE = re.compile(r'([A-Za-z]\w*(?: [A-Za-z]\w*)?)\s*=\s*(\S+)')
+
+    def __init__(self, filename):
+        with open(filename) as oszicar:
+            lines = np.array(oszicar.read().splitlines())
+        self.scf, self.ionic = self.parse_lines(lines)
+
+    @classmethod
+    def parse_lines(cls, lines):
+        """
+        Convert an array of OSZICAR lines
+
+        :return: scf, ionic dicts of arrays
+        """
+        if not lines.size:
+            return {name: np.array([]) for name in cls._SCF_FIELDS}, {}
+        is_scf = np.char.find(lines, ':') == 3
+        is_ionic = ~is_scf & (np.char.find(lines, 'F=') >= 0)
+        scf_lines = lines[is_scf]
+        rows = cls._SCF_LINE.findall('\n'.join(scf_lines))
+        if len(rows) != len(scf_lines):
+            rows = [cls._scf_row(line) for line in scf_lines]
+        values = np.array(rows, dtype=str).reshape(-1, len(cls._SCF_FIELDS))
+        values[values == ''] = 'nan'
+        values = values.astype(float)
+        scf = {name: values[:, i] for i, name in enumerate(cls._SCF_FIELDS)}
+        scf['ionic_step'] = np.cumsum(is_ionic)[is_scf]
+        ionic_values = [
+            dict(cls._IONIC_VALUE.findall(line)) for line in lines[is_ionic]
+        ]
+        ionic = {}
+        for key in ionic_values[0] if ionic_values else []:
+            ionic[key.replace(' ', '').lower()] = np.array(
+                [float(step.get(key, 'nan')) for step in ionic_values])
+        return scf, ionic
+
+    @classmethod
+    def _scf_row(cls, line):
+        """The values of one electronic step line, nan if it can not be read"""
+        match = cls._SCF_LINE.match(line)
+        if not match:
+            return ('nan', ) * len(cls._SCF_FIELDS)
+        return match.groups('')
+
+    @property
+    def scf_steps_per_ionic_step(self):
+        """Number of electronic steps in each ionic step, including an unfinished last one"""
+        return np.bincount(
+            self.scf['ionic_step'].astype(int),
+            minlength=len(self.ionic.get('f', [])))
+
+    def get_summary(self):
+        """Summary statistics of the convergence history"""
+        steps = self.scf_steps_per_ionic_step
+        summary = {
+            'num_ionic_steps': len(self.ionic.get('f', [])),
+            'num_scf_steps': int(steps.sum()),
+            'scf_steps_per_ionic_step': steps.tolist()
+        }
+        if steps.size:
+            summary['max_scf_steps'] = int(steps.max())
+            summary['mean_scf_steps'] = float(steps.mean())
+        if self.scf['de'].size:
+            summary['final_de'] = self.scf['de'][-1]
+        for key in ['f', 'e0', 'mag']:
+            if key in self.ionic:
+                summary['final_' + key] = self.ionic[key][-1]
+        return summary
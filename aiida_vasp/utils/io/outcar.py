@@ -0,0 +1,220 @@
+"""
+Tools for parsing OUTCAR files
+"""
+import mmap
+import re
+
+import numpy as np
+
+from .parser import BaseParser
+
+
+def _anchor(name, section, literal, rest='', head=False):
+    """
+    An OUTCAR anchor: a literal text followed by a pattern for the values
+
+    :param head: the text is printed once, near the start of the file
+    """
+    return (name, section, literal, re.compile(re.escape(literal) + rest),
+            head)
+
+
+_FLOAT = r'\s+(-?\d*\.?\d+(?:[eE][-+]?\d+)?)'
+
+
+class OutcarParser(BaseParser):
+    """
+    Read energies, forces, stress, magnetization, timing and memory usage from an OUTCAR file
+
+    The file is memory mapped and scanned for precompiled anchors,
+    only the anchors of the requested sections are searched for and converted.
+    With final_only=True, only the last occurrence of each anchor is searched for,
+    backwards from the end of the file, which only touches the tail of a long OUTCAR.
+
+    :param sections: any of :py:attr:`SECTIONS` (default: all)
+    :param final_only: only read the values of the final ionic step
+    """
+
+    SECTIONS = [
+        'energies', 'forces', 'stress', 'magnetization', 'timing', 'memory'
+    ]
+
+    _ANCHORS = [
+        _anchor(
+            'energy', 'energies', 'FREE ENERGIE OF THE ION-ELECTRON SYSTEM',
+            r'[^=]*=' + _FLOAT + r'\s*eV\s+energy\s+without entropy\s*=' +
+            _FLOAT + r'\s+energy\(sigma->0\)\s*=' + _FLOAT),
+        _anchor('forces', 'forces', 'TOTAL-FORCE (eV/Angst)',
+                r'[^\n]*\n[ -]+\n((?:[ \t]+-?[\d.][^\n]*\n)+)'),
+        _anchor('stress', 'stress', '  in kB', r'((?:\s*-?\d+\.\d+){6})'),
+        _anchor('magnetization', 'magnetization', ' number of electron',
+                _FLOAT + r'\s+magnetization[ \t]+(-?\d*\.?\d+)'),
+        _anchor('loop', 'timing', 'LOOP:',
+                r'\s+cpu time' + _FLOAT + r':\s*real time' + _FLOAT),
+        _anchor('loop_plus', 'timing', 'LOOP+:',
+                r'\s+cpu time' + _FLOAT + r':\s*real time' + _FLOAT),
+        _anchor('total_cpu_time', 'timing', 'Total CPU time used (sec):',
+                _FLOAT),
+        _anchor('user_time', 'timing', 'User time (sec):', _FLOAT),
+        _anchor('system_time', 'timing', 'System time (sec):', _FLOAT),
+        _anchor('elapsed_time', 'timing', 'Elapsed time (sec):', _FLOAT),
+        _anchor(
+            'root_node_memory',
+            'memory',
+            'total amount of memory used by VASP on root node',
+            _FLOAT,
+            head=True),
+        _anchor('maximum_memory', 'memory', 'Maximum memory used (kb):',
+                _FLOAT),
+        _anchor('average_memory', 'memory', 'Average memory used (kb):',
+                _FLOAT)
+    ]
+
+    def __init__(self, filename, sections=None, final_only=False):
+        if sections is None:
+            sections = self.SECTIONS
+        unknown = set(sections).difference(self.SECTIONS)
+        if unknown:
+            raise ValueError('unknown OUTCAR sections: {}'.format(
+                ', '.join(sorted(unknown))))
+        self.filename = filename
+        self.final_only = final_only
+        anchors = [anchor for anchor in self._ANCHORS if anchor[1] in sections]
+        self.values = {anchor[0]: [] for anchor in anchors}
+        with open(filename, 'rb') as outcar:
+            data = mmap.mmap(outcar.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if final_only:
+                    matches = self._find_last(data, anchors)
+                else:
+                    matches = self._find_all(data, anchors)
+                for name, match in matches:
+                    self.values[name].append(self._convert(name, match))
+            finally:
+                data.close()
+
+    @staticmethod
+    def _find_all(data, anchors):
+        """Scan the file once for all anchors, yield (name, match) in file order"""
+        patterns = {anchor[0]: anchor[3] for anchor in anchors}
+        combined = re.compile('|'.join(
+            '(?P<{}>{})'.format(anchor[0], re.escape(anchor[2]))
+            for anchor in anchors))
+        for hit in combined.finditer(data):
+            match = patterns[hit.lastgroup].match(data, hit.start())
+            if match:
+                yield hit.lastgroup, match
+
+    @staticmethod
+    def _find_last(data, anchors):
+        """Search backwards from the end (forward for head anchors), yield (name, match)"""
+        for name, _, literal, pattern, head in anchors:
+            if head:
+                pos = data.find(literal)
+                while pos != -1 and not pattern.match(data, pos):
+                    pos = data.find(literal, pos + 1)
+            else:
+                pos = data.rfind(literal)
+                while pos != -1 and not pattern.match(data, pos):
+                    pos = data.rfind(literal, 0, pos + len(literal) - 1)
+            if pos != -1:
+                yield name, pattern.match(data, pos)
+
+    @staticmethod
+    def _convert(name, match):
+        """Convert the matched values"""
+        if name == 'forces':
+            rows = np.fromstring(match.group(1), sep=' ')
+            return rows.reshape(-1, 6)[:, 3:]
+        if name == 'stress':
+            # XX YY ZZ XY YZ ZX, the columns can run into each other
+            xx, yy, zz, xy, yz, zx = map(
+                float, re.findall(r'-?\d+\.\d+', match.group(1)))
+            return np.array([[xx, xy, zx], [xy, yy, yz], [zx, yz, zz]])
+        values = map(float, match.groups())
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    @property
+    def energies(self):
+        """free energy, energy without entropy and energy(sigma->0) per ionic step"""
+        energies = np.array(self.values.get('energy', [])).reshape(-1, 3)
+        return {
+            'free_energy': energies[:, 0],
+            'energy_without_entropy': energies[:, 1],
+            'energy_sigma_0': energies[:, 2]
+        }
+
+    @property
+    def forces(self):
+        """(nsteps, natoms, 3) array of the forces in eV/Angstrom"""
+        return np.array(self.values.get('forces', []))
+
+    @property
+    def stress(self):
+        """(nsteps, 3, 3) array of the stress in kB"""
+        return np.array(self.values.get('stress', []))
+
+    @property
+    def magnetization(self):
+        """Total magnetization per electronic step, empty for non spin polarized runs"""
+        return np.array(self.values.get('magnetization', [])).reshape(-1, 2)[:,
+                                                                          1]
+
+    @property
+    def timing(self):
+        """
+        (cpu, real) times in seconds of the electronic ('loop') and ionic ('loop_plus')
+        steps, and the total times of the job
+        """
+        timing = {
+            'loop': np.array(self.values.get('loop', [])).reshape(-1, 2),
+            'loop_plus': np.array(self.values.get('loop_plus', [])).reshape(
+                -1, 2)
+        }
+        for name in [
+                'total_cpu_time', 'user_time', 'system_time', 'elapsed_time'
+        ]:
+            if self.values.get(name):
+                timing[name] = self.values[name][-1]
+        return timing
+
+    @property
+    def memory(self):
+        """Memory usage in kB"""
+        return {
+            name: self.values[name][-1]
+            for name in
+            ['root_node_memory', 'maximum_memory', 'average_memory']
+            if self.values.get(name)
+        }
+
+    def get_output_dict(self):
+        """The final values of the parsed sections, for an output parameters node"""
+        output = {}
+        for name, energies in self.energies.iteritems():
+            if energies.size:
+                output[name] = energies[-1]
+        if self.values.get('forces'):
+            output['max_force'] = np.linalg.norm(
+                self.values['forces'][-1], axis=1).max()
+        if self.values.get('stress'):
+            output['stress'] = self.values['stress'][-1].tolist()
+        magnetization = self.magnetization
+        if magnetization.size:
+            output['magnetization'] = magnetization[-1]
+        timing = self.timing
+        for name in ['loop', 'loop_plus']:
+            if timing[name].size:
+                output[name + '_real_time'] = timing.pop(name)[-1, 1]
+            else:
+                timing.pop(name)
+        output.update(timing)
+        output.update(
+            {name + '_kb': value
+             for name, value in self.memory.iteritems()})
+        if not self.final_only:
+            output['num_ionic_steps'] = len(self.values.get('energy', []))
+            output['num_electronic_steps'] = len(self.values.get('loop', []))
+        return output
@@ -3,19 +3,100 @@ This module contains tools to read PawData attributes from POTCAR files.
 """
 import re
 import datetime as dt
+import hashlib
 import os
+import shutil
+import threading
+from collections import OrderedDict
 
 from .parser import KeyValueParser
 
+HEADER_END = 'END of PSCTR'
+DATASET_END = 'End of Dataset'
 
-class PotParser(KeyValueParser):
+
+def iter_datasets(potcar, keep_data=True, header_only=False):
     """
-    contains regex and functions to find grammar elements
-    for POTCAR files
+    Split a (possibly concatenated) POTCAR into its datasets, in one pass over the lines
+
+    The header of a dataset ends with the PSCTR parameters, the remaining (numeric) lines
+    are only checked for the end of the dataset. Anything after the last 'End of Dataset'
+    line is part of the last dataset (or a dataset of its own, if it is not blank), so the
+    datasets joined are the file.
+
+    :param potcar: file object or iterable of lines
+    :param keep_data: also yield the full text of each dataset, otherwise None
+    :param header_only: stop reading after the header of the first dataset
+    :return: generator of (header lines, text of the dataset)
+    """
+    pending = None
+    header, lines = [], []
+    in_header = True
+    for line in potcar:
+        if keep_data:
+            lines.append(line)
+        stripped = line.lstrip()
+        if in_header:
+            if stripped.startswith(HEADER_END) or stripped.startswith(
+                    DATASET_END):
+                in_header = False
+                if header_only:
+                    yield header, None
+                    return
+            else:
+                header.append(line)
+        if stripped.startswith(DATASET_END):
+            if pending:
+                yield pending
+            pending = header, ''.join(lines) if keep_data else None
+            header, lines = [], []
+            in_header = True
+    if header_only:
+        if header:
+            yield header, None
+        return
+    if pending and not ''.join(header).strip():
+        pending = pending[0], pending[1] + ''.join(
+            lines) if keep_data else None
+        header = []
+    if pending:
+        yield pending
+    if ''.join(header).strip():
+        yield header, ''.join(lines) if keep_data else None
+
+
+class HeaderParser(KeyValueParser):
+    """
+    Key value parsing of the dataset headers of POTCAR files
+
+    Only the header lines are matched against the regex, the data sections are skipped
+    (see :py:func:`iter_datasets`).
     """
     assignment = re.compile(r'(\w*)\s*=\s*([^;]*);?')
     comments = True
 
+    @classmethod
+    def header_kv_list(cls, header):
+        return filter(None, map(cls.find_kv, header))
+
+    @classmethod
+    def kv_list(cls, filename, header_only=False):
+        """Key value pairs of the headers of all datasets (or only the first one) of a POTCAR file"""
+        with open(filename, 'rb') as potcar:
+            return [
+                kv
+                for header, _ in iter_datasets(
+                    potcar, keep_data=False, header_only=header_only)
+                for kv in cls.header_kv_list(header)
+            ]
+
+
+class PotParser(HeaderParser):
+    """
+    contains regex and functions to find grammar elements
+    for POTCAR files
+    """
+
     @classmethod
     def single(cls, kv_list):
         k_list = [ssl[0] for subl in kv_list for ssl in subl]
@@ -76,13 +157,11 @@ class PotParser(KeyValueParser):
         return attr_dict
 
 
-class PawParser(KeyValueParser):
+class PawParser(HeaderParser):
     """
     contains regex and functions to find grammar elements
     in POTCAR files in PAW libraries
     """
-    assignment = re.compile(r'(\w*)\s*=\s*([^;]*);?')
-    comments = True
 
     @classmethod
     def single(cls, kv_list):
@@ -109,11 +188,48 @@ class PawParser(KeyValueParser):
 
     @classmethod
     # pylint: disable=too-many-locals
-    def parse_potcar(cls, filename):
-        """Parse a Vasp POTCAR file"""
-        kv_list = cls.kv_list(filename)
+    def parse_potcar(cls, filename, header_only=False):
+        """
+        Parse a Vasp POTCAR file
+
+        :param header_only: read no further than the header of the first dataset,
+            without checking that the file is not a concatenated one
+        """
+        kv_list = cls.kv_list(filename, header_only=header_only)
+        if not cls.single(kv_list):
+            raise ValueError('not parsing concatenated POTCAR files')
+        return cls.parse_header(kv_list, filename)
+
+    @classmethod
+    def parse_potcars(cls, filename):
+        """Parse each dataset of a (possibly concatenated) POTCAR file, return a list of attribute dicts"""
+        with open(filename, 'rb') as potcar:
+            return [
+                cls.parse_header(cls.header_kv_list(header), filename)
+                for header, _ in iter_datasets(potcar, keep_data=False)
+            ]
+
+    @classmethod
+    def scan_potcar(cls, filename):
+        """
+        Parse a single POTCAR file and compute its md5 sum, reading it only once
+
+        :return: (md5, attribute dict)
+        """
+        md5 = hashlib.md5()
+        kv_list = []
+        with open(filename, 'rb') as potcar:
+            for header, data in iter_datasets(potcar):
+                md5.update(data)
+                kv_list.extend(cls.header_kv_list(header))
         if not cls.single(kv_list):
             raise ValueError('not parsing concatenated POTCAR files')
+        return md5.hexdigest(), cls.parse_header(kv_list, filename)
+
+    @classmethod
+    # pylint: disable=too-many-locals
+    def parse_header(cls, kv_list, filename):
+        """Get the attributes from the key value pairs of a dataset header"""
         kv_dict = cls.kv_dict(kv_list)
         is_paw, _ = cls.bool(kv_dict.get('LPAW', 'T'))
         is_ultrasoft, _ = cls.bool(kv_dict.get('LULTRA', 'F'))
@@ -155,3 +271,63 @@ class PawParser(KeyValueParser):
             raise err.__class__(msg)
 
         return attr_dict
+
+
+def concatenate_potcars(paths, dst):
+    """Write the concatenation of the POTCAR files at paths to the file object dst"""
+    for path in paths:
+        with open(path, 'rb') as potcar:
+            shutil.copyfileobj(potcar, dst)
+
+
+class PotcarCache(object):
+    """
+    Size bounded LRU cache of concatenated POTCARs, kept in memory
+
+    The entries are keyed by the ordered tuple of the md5 sums of the parts,
+    which identifies the contents of the concatenation. It is safe to share
+    between threads.
+    """
+
+    def __init__(self, max_size=64 * 1024**2):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key, paths):
+        """
+        The concatenation of the POTCAR files at paths, from the cache if possible
+
+        :param key: tuple of the md5 sums of the files
+        """
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+                return data
+        parts = []
+        for path in paths:
+            with open(path, 'rb') as potcar:
+                parts.append(potcar.read())
+        data = b''.join(parts)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._size += len(data)
+            while self._size > self.max_size and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,158 @@
+"""
+Tools for parsing PROCAR files
+"""
+import mmap
+import re
+
+import numpy as np
+
+from .parser import BaseParser
+
+
+class ProcarParser(BaseParser):
+    """
+    Read the band projections of a PROCAR file into a dense tensor
+
+    The file is memory mapped and scanned once for the byte offsets of the
+    per band projection tables, each table is then converted in one call
+    straight into the preallocated (nspin, nkp, nbands, nions, norb) tensor.
+    Only the selected ions and orbitals are kept.
+
+    Collinear (ISPIN = 1, 2) files are supported, for non-collinear runs the
+    total (first) table of each band is read. Phase factors (LORBIT = 12) are skipped.
+
+    :keyword ions: indices of the ions to keep (default: all)
+    :keyword orbitals: names (as in the table header, like 's', 'px', 'dxy')
+        or indices of the orbitals to keep (default: all)
+    :keyword dtype: float type of the projections (default: float32)
+    """
+
+    _HEADER = re.compile(
+        r'# of k-points:\s*(\d+)\s+# of bands:\s*(\d+)\s+# of ions:\s*(\d+)')
+    _FLOAT = re.compile(r'-?\d+\.\d+')
+
+    def __init__(self, filename, **kwargs):
+        self.filename = filename
+        with open(filename, 'rb') as procar:
+            data = mmap.mmap(procar.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.header = self.read_header(data)
+                ions = self.get_ion_index(kwargs.get('ions'))
+                orbitals = self.get_orbital_index(kwargs.get('orbitals'))
+                self.blocks = self.index_blocks(data, self.header)
+                self.kpoints, self.weights = self.read_kpoints(
+                    data, self.header)
+                self.energies, self.occupations = self.read_band_values(
+                    data, self.blocks)
+                self.projections = self.read_projections(
+                    data, self.blocks, ions, orbitals,
+                    kwargs.get('dtype', np.float32))
+            finally:
+                data.close()
+        self.ions = ions
+        self.orbitals = [self.header['orbitals'][i] for i in orbitals]
+
+    @classmethod
+    def read_header(cls, data):
+        """Read the numbers of spins, kpoints, bands, ions and the orbital names"""
+        match = cls._HEADER.search(data)
+        if not match:
+            raise ValueError('not a PROCAR file')
+        num_kp, num_bands, num_ions = map(int, match.groups())
+        num_spins = 1
+        pos = data.find(b'# of k-points:', match.end())
+        while pos != -1:
+            num_spins += 1
+            pos = data.find(b'# of k-points:', pos + 1)
+        table = data.find(b'\nion ')
+        orbitals = data[table:data.find(b'\n', table + 1)].split()[1:-1]
+        return {
+            'n_spins': num_spins,
+            'n_kp': num_kp,
+            'n_bands': num_bands,
+            'n_ions': num_ions,
+            'orbitals': orbitals
+        }
+
+    @staticmethod
+    def index_blocks(data, header):
+        """
+        Find the per band projection tables
+
+        :return: (nspin, nkp, nbands, 3) array of (band header, table start, table end)
+            byte offsets, the table being the rows of the ions
+        """
+        shape = (header['n_spins'], header['n_kp'], header['n_bands'])
+        blocks = np.empty(shape + (3, ), dtype=np.int64)
+        flat = blocks.reshape(-1, 3)
+        pos = data.find(b'\nband ')
+        for i in range(len(flat)):
+            if pos == -1:
+                raise ValueError('PROCAR holds {} bands, expected {}'.format(
+                    i, len(flat)))
+            start = data.find(b'\n', data.find(b'\nion ', pos) + 1) + 1
+            end = data.find(b'\ntot', start) + 1
+            flat[i] = pos + 1, start, end
+            pos = data.find(b'\nband ', end)
+        return blocks
+
+    @classmethod
+    def read_kpoints(cls, data, header):
+        """Read the coordinates and weights of the kpoints of the first spin"""
+        kpoints = np.empty((header['n_kp'], 3))
+        weights = np.empty(header['n_kp'])
+        pos = data.find(b' k-point ')
+        for i in range(header['n_kp']):
+            line = data[pos:data.find(b'\n', pos)]
+            # the coordinates can run into each other: 0.50000000-0.50000000
+            values = map(float, cls._FLOAT.findall(line.split(':', 1)[1]))
+            kpoints[i], weights[i] = values[:3], values[-1]
+            pos = data.find(b' k-point ', pos + 1)
+        return kpoints, weights
+
+    @staticmethod
+    def read_band_values(data, blocks):
+        """Read the energy and occupation of every band from the band header lines"""
+        energies = np.empty(blocks.shape[:3])
+        occupations = np.empty(blocks.shape[:3])
+        flat_energies = energies.reshape(-1)
+        flat_occupations = occupations.reshape(-1)
+        for i, (pos, start, _) in enumerate(blocks.reshape(-1, 3)):
+            # band     1 # energy  -6.71498442 # occ.  2.00000000
+            values = data[pos:data.find(b'\n', pos, start)].split()
+            flat_energies[i] = float(values[4])
+            flat_occupations[i] = float(values[7])
+        return energies, occupations
+
+    def read_projections(self, data, blocks, ions, orbitals, dtype):
+        """Convert the selected rows and columns of every table"""
+        num_ions = self.header['n_ions']
+        # columns: ion index, orbitals..., tot
+        num_cols = len(self.header['orbitals']) + 2
+        columns = [i + 1 for i in orbitals]
+        projections = np.empty(
+            blocks.shape[:3] + (len(ions), len(columns)), dtype=dtype)
+        flat = projections.reshape((-1, ) + projections.shape[3:])
+        for i, (_, start, end) in enumerate(blocks.reshape(-1, 3)):
+            table = np.fromstring(data[start:end], sep=' ')
+            flat[i] = table.reshape(num_ions, num_cols)[ions][:, columns]
+        return projections
+
+    def get_ion_index(self, ions):
+        if ions is None:
+            return range(self.header['n_ions'])
+        return list(ions)
+
+    def get_orbital_index(self, orbitals):
+        names = self.header['orbitals']
+        if orbitals is None:
+            return range(len(names))
+        index = []
+        for orbital in orbitals:
+            if orbital in names:
+                index.append(names.index(orbital))
+            elif isinstance(orbital, int) and 0 <= orbital < len(names):
+                index.append(orbital)
+            else:
+                raise ValueError('unknown PROCAR orbital: {}'.format(orbital))
+        return index
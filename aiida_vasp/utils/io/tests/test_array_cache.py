@@ -0,0 +1,87 @@
+"""Unittests for the on disk array cache"""
+# pylint: disable=redefined-outer-name
+import os
+
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.cache import ArrayCache
+from aiida_vasp.utils.io.doscar import DosParser
+from aiida_vasp.utils.io.eigenval import EigParser
+from aiida_vasp.utils.io.vasprun import VasprunParser
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return ArrayCache(str(tmpdir.join('cache')))
+
+
+def test_eigenval_cached(cache):
+    """The second parse loads the arrays from the cache"""
+    _, kpoints, bands = EigParser.parse_eigenval(
+        data_path('phonondb', 'EIGENVAL'), cache=cache)
+    assert cache.size() > 0
+    _, cached_kpoints, cached_bands = EigParser.parse_eigenval(
+        data_path('phonondb', 'EIGENVAL'), cache=cache)
+    assert isinstance(cached_bands, numpy.memmap)
+    assert numpy.all(cached_kpoints == kpoints)
+    assert numpy.all(cached_bands == bands)
+
+
+def test_vasprun_cached(cache):
+    """Arrays are shared between parser instances through the cache"""
+    bands = VasprunParser(data_path('phonondb', 'vasprun.xml'),
+                          cache=cache).bands
+    cached = VasprunParser(data_path('phonondb', 'vasprun.xml'), cache=cache)
+    assert isinstance(cached._array(parent='calculation/eigenvalues'),  # pylint: disable=protected-access
+                      numpy.memmap)
+    assert numpy.all(cached.bands == bands)
+
+
+def test_doscar_cached(cache):
+    header, tdos, _ = DosParser.parse_doscar(data_path('phonondb', 'DOSCAR'))
+    parser = DosParser(data_path('phonondb', 'DOSCAR'), cache=cache)
+    assert parser.header == header
+    assert numpy.all(parser.tdos == tdos)
+
+
+def test_evict(cache):
+    """The least recently used entries are removed beyond the size limit"""
+    old = cache.entry(data_path('phonondb', 'EIGENVAL'), 'test', 1)
+    old.put('array', numpy.zeros(1000))
+    os.utime(old.path, (0, 0))
+    new = cache.entry(data_path('phonondb', 'DOSCAR'), 'test', 1)
+    new.put('array', numpy.zeros(1000))
+    cache.max_size = cache.size() - 1
+    cache.evict()
+    assert old.get('array') is None
+    assert new.get('array') is not None
+
+
+def test_put_keeps_running_size(cache, monkeypatch):
+    """Only the first put and puts beyond the size limit scan the cache directory"""
+    scans = []
+    entries = cache._entries  # pylint: disable=protected-access
+
+    def count_scans():
+        scans.append(1)
+        return entries()
+
+    monkeypatch.setattr(cache, '_entries', count_scans)
+    entry = cache.entry(data_path('phonondb', 'EIGENVAL'), 'test', 1)
+    entry.put('first', numpy.zeros(1000))
+    entry.put('second', numpy.zeros(1000))
+    assert len(scans) == 1
+    cache.max_size = 2 * 8000
+    entry.put('third', numpy.zeros(1000))
+    assert len(scans) == 2
+    assert entry.get('third') is None
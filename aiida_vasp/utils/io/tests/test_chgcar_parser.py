@@ -0,0 +1,76 @@
+"""Unittests for the CHGCAR parser"""
+# pylint: disable=redefined-outer-name
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.chgcar import ChgcarParser
+
+HEADER = """GaAs
+   1.00000000000000
+     0.000000    2.826625    2.826625
+     2.826625    0.000000    2.826625
+     2.826625    2.826625    0.000000
+   Ga   As
+     1     1
+Direct
+  0.000000  0.000000  0.000000
+  0.250000  0.250000  0.250000
+
+"""
+
+
+def grid_lines(values):
+    """Format grid values five per line, x running fastest"""
+    values = values.reshape(-1, order='F')
+    return [
+        ''.join(' {:17.11E}'.format(value) for value in values[i:i + 5])
+        for i in range(0, values.size, 5)
+    ]
+
+
+@pytest.fixture()
+def chgcar(tmpdir):
+    """A spin polarized CHGCAR on a 3 x 4 x 5 grid"""
+    random = numpy.random.RandomState(0)
+    density, magnetization = random.rand(2, 3, 4, 5)
+    lines = ['    3    4    5'] + grid_lines(density)
+    lines += [
+        'augmentation occupancies   1   2',
+        '  0.1405770E+01 -0.1166391E+01',
+        'augmentation occupancies   2   2',
+        '  0.1534405E+01 -0.1318553E+01',
+        '  0.000000E+00  0.000000E+00',
+    ]
+    lines += ['    3    4    5'] + grid_lines(magnetization)
+    path = str(tmpdir.join('CHGCAR'))
+    with open(path, 'w') as chgcar_file:
+        chgcar_file.write(HEADER + '\n'.join(lines) + '\n')
+    return path, density, magnetization
+
+
+def test_parse_header(chgcar):
+    path, _, _ = chgcar
+    parser = ChgcarParser(path)
+    assert parser.header['grid'] == [3, 4, 5]
+    assert parser.header['coordinates'] == 'direct'
+    assert parser.header['positions'].shape == (2, 3)
+    assert parser.header['cell'][0, 1] == 2.826625
+    assert parser.symbols == ['Ga', 'As']
+    assert parser.grid_names == ['density', 'magnetization']
+
+
+def test_read_grid(chgcar, tmpdir):
+    path, density, magnetization = chgcar
+    parser = ChgcarParser(path, chunk_size=64)
+    grid = parser.read_grid()
+    assert grid.shape == (3, 4, 5)
+    assert numpy.allclose(grid, density)
+    out = numpy.lib.format.open_memmap(
+        str(tmpdir.join('magnetization.npy')),
+        mode='w+',
+        shape=(3, 4, 5),
+        fortran_order=True)
+    parser.read_grid('magnetization', out=out)
+    assert numpy.allclose(
+        numpy.load(str(tmpdir.join('magnetization.npy')), mmap_mode='r'),
+        magnetization)
@@ -0,0 +1,21 @@
+"""Unittests for the stream compression helpers"""
+import pytest
+
+from aiida_vasp.utils.io.compression import (CODECS, compress_file,
+                                             decompress_file)
+
+
+@pytest.mark.parametrize('compression', sorted(CODECS))
+def test_round_trip(compression, tmpdir):
+    src = tmpdir.join('CHGCAR')
+    src.write(' 0.12345678901E+01 -.23703901816E+01\n' * 10000)
+    compressed = str(tmpdir.join('CHGCAR' + CODECS[compression][1]))
+    compress_file(str(src), compressed, compression, level=1)
+    assert tmpdir.join('CHGCAR' + CODECS[compression][1]).size() < src.size()
+    decompress_file(compressed, str(tmpdir.join('out')), compression)
+    assert tmpdir.join('out').read() == src.read()
+
+
+def test_unknown_compression(tmpdir):
+    with pytest.raises(ValueError):
+        compress_file(__file__, str(tmpdir.join('out')), 'zip')
@@ -0,0 +1,50 @@
+"""Unittests for the DOSCAR parser"""
+import os
+
+import numpy
+
+from aiida_vasp.utils.io.doscar import DosParser
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+def nscf_doscar():
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../backendtests/data/retrieved_nscf',
+                     'path', 'DOSCAR'))
+    assert os.path.exists(path)
+    return path
+
+
+def test_parse_doscar_tdos_only():
+    header, tdos, pdos = DosParser.parse_doscar(data_path('phonondb', 'DOSCAR'))
+    assert header['n_dos'] == 301
+    assert tdos.shape == (301, 3)
+    assert tdos[0, 0] == -13.778
+    assert not pdos
+
+
+def test_parse_doscar_pdos():
+    """Every ion block is read into one contiguous array"""
+    header, tdos, pdos = DosParser.parse_doscar(nscf_doscar())
+    assert tdos.shape == (301, 3)
+    assert pdos.shape == (header['n_ions'], 301, 10)
+    assert pdos[0, 0, 0] == -11.397
+    assert pdos[-1, -1, 0] == tdos[-1, 0]
+
+
+def test_lazy_ion_subset():
+    """A lazy parser reads only the requested ions, on request"""
+    full = DosParser(nscf_doscar())
+    lazy = DosParser(nscf_doscar(), lazy=True)
+    assert lazy._pdos is None  # pylint: disable=protected-access
+    subset = lazy.get_pdos([3, 1])
+    assert numpy.all(subset == full.pdos[[3, 1]])
+    assert numpy.all(lazy.pdos == full.pdos)
@@ -0,0 +1,54 @@
+"""Unittests for the EIGENVAL parser"""
+import os
+
+import numpy
+
+from aiida_vasp.utils.io.eigenval import EigParser
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+def test_parse_eigenval():
+    """EIGENVAL with occupations column"""
+    header, kpoints, bands = EigParser.parse_eigenval(
+        data_path('phonondb', 'EIGENVAL'))
+    assert header['n_kp'] == 2
+    assert header['n_bands'] == 452
+    assert kpoints.shape == (2, 4)
+    assert numpy.all(kpoints[0] == numpy.array([0., 0., 0., 0.5]))
+    assert bands.shape == (1, 2, 452)
+    assert bands[0, 0, 0] == -12.746020
+    assert bands[0, 0, 11] == -12.436271
+
+
+def test_parse_eigenval_spin(tmpdir):
+    """Spin polarized EIGENVAL without occupations, bands out of order"""
+    eigenval = tmpdir.join('EIGENVAL')
+    eigenval.write('\n'.join([
+        '    1    1    1    2',
+        '  0.1E+02  0.1E-08  0.1E-08  0.1E-08  0.5E-15',
+        '  1.0E-004',
+        '  CAR ',
+        ' unknown system',
+        '      4      2      2',
+        '',
+        '  0.0E+00  0.0E+00  0.0E+00  0.5E+00',
+        '    2      -1.0   -1.5',
+        '    1      -2.0   -2.5',
+        '',
+        '  0.0E+00  0.0E+00  0.5E+00  0.5E+00',
+        '    1      -3.0   -3.5',
+        '    2      -4.0   -4.5',
+        ''
+    ]))
+    _, kpoints, bands = EigParser.parse_eigenval(str(eigenval))
+    assert numpy.all(kpoints[:, 2] == numpy.array([0., 0.5]))
+    assert numpy.all(bands[0] == numpy.array([[-2.0, -1.0], [-3.0, -4.0]]))
+    assert numpy.all(bands[1] == numpy.array([[-2.5, -1.5], [-3.5, -4.5]]))
@@ -0,0 +1,56 @@
+"""Unittests for the OSZICAR parser"""
+import os
+
+import numpy
+
+from aiida_vasp.utils.io.oszicar import OszicarParser
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+def test_parse_oszicar():
+    parser = OszicarParser(data_path('phonondb', 'OSZICAR'))
+    assert parser.scf['e'].shape == (27, )
+    assert parser.scf['ncg'][0] == 1808
+    assert numpy.isnan(parser.scf['rmsc'][0])
+    assert parser.scf['rmsc'][4] == 0.735e1
+    assert parser.ionic['f'][-1] == -0.45987614e3
+    summary = parser.get_summary()
+    assert summary['num_ionic_steps'] == 1
+    assert summary['scf_steps_per_ionic_step'] == [27]
+
+
+def test_md_lines():
+    """MD ionic lines and an unfinished last ionic step"""
+    lines = numpy.array([
+        'RMM:   1    -0.1E+03   -0.2E+01   -0.3E+01   100   0.1E+00',
+        '   1 T=   300. E= -.10E+03 F= -.11E+03 E0= -.11E+03  EK= 0.1E+01 '
+        'SP= 0.0E+00 SK= 0.0E+00 mag=     2.0000',
+        'RMM:   1    -0.1E+03   -0.2E+01   -0.3E+01   100   0.1E+00    0.2E+00',
+    ])
+    scf, ionic = OszicarParser.parse_lines(lines)
+    assert numpy.all(scf['ionic_step'] == [0, 1])
+    assert ionic['t'][0] == 300
+    assert ionic['mag'][0] == 2
+
+
+def test_overflowed_field():
+    """A line with an overflowed field is filled with nan, not shifted"""
+    lines = numpy.array([
+        'DAV:   1    -0.1E+03   -0.2E+01   -0.3E+01   100   0.1E+00',
+        '   1 F= -.11E+03 E0= -.11E+03  d E =-.1E+03',
+        'DAV:   1    ********   -0.2E+01   -0.3E+01   100   0.1E+00',
+        'DAV:   2    -0.3E+03   -0.2E+01   -0.3E+01   100   0.1E+00',
+    ])
+    scf, _ = OszicarParser.parse_lines(lines)
+    assert numpy.all(scf['ionic_step'] == [0, 1, 1])
+    assert numpy.isnan(scf['e'][1])
+    assert scf['e'][2] == -0.3E+03
+    assert scf['n'][2] == 2
@@ -0,0 +1,49 @@
+"""Unittests for the OUTCAR parser"""
+import os
+
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.outcar import OutcarParser
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+def test_parse_outcar():
+    parser = OutcarParser(data_path('phonondb', 'OUTCAR'))
+    assert parser.energies['free_energy'][-1] == -459.87614130
+    assert parser.forces.shape == (1, 104, 3)
+    assert numpy.all(parser.forces[0, 0] == [-0.232721, -0.011159, 0.034497])
+    assert parser.stress[0, 0, 0] == 0.57128
+    assert parser.timing['loop'].shape == (27, 2)
+    assert parser.timing['elapsed_time'] == 632.626
+    assert parser.memory['maximum_memory'] == 174924
+    assert not parser.magnetization.size
+
+
+def test_final_only():
+    """Searching from the end gives the same final values"""
+    full = OutcarParser(data_path('phonondb', 'OUTCAR')).get_output_dict()
+    final = OutcarParser(
+        data_path('phonondb', 'OUTCAR'), final_only=True).get_output_dict()
+    assert full['num_electronic_steps'] == 27
+    assert 'num_electronic_steps' not in final
+    for name, value in final.iteritems():
+        assert numpy.allclose(value, full[name])
+
+
+def test_sections():
+    parser = OutcarParser(
+        data_path('phonondb', 'OUTCAR'), sections=['memory'])
+    assert set(parser.values) == {
+        'root_node_memory', 'maximum_memory', 'average_memory'
+    }
+    with pytest.raises(ValueError):
+        OutcarParser(data_path('phonondb', 'OUTCAR'), sections=['unknown'])
@@ -0,0 +1,37 @@
+"""Unittests for the concatenated POTCAR cache"""
+# pylint: disable=redefined-outer-name
+import StringIO
+
+import pytest
+
+from aiida_vasp.utils.io.potcar import PotcarCache, concatenate_potcars
+
+
+@pytest.fixture()
+def potcars(tmpdir):
+    """Three fake POTCAR files of 1000 bytes each"""
+    paths = []
+    for symbol in ['In_d', 'As', 'Ga']:
+        path = tmpdir.join(symbol)
+        path.write((' PAW_PBE {}\n'.format(symbol) * 100)[:999] + '\n')
+        paths.append(str(path))
+    return paths
+
+
+def test_concatenate(potcars):
+    dst = StringIO.StringIO()
+    concatenate_potcars(potcars[:2], dst)
+    assert dst.getvalue() == ''.join(open(path).read() for path in potcars[:2])
+
+
+def test_cache(potcars):
+    cache = PotcarCache(max_size=2500)
+    first = cache.get(('in', 'as'), potcars[:2])
+    assert first == ''.join(open(path).read() for path in potcars[:2])
+    assert cache.get(('in', 'as'), []) is first
+    assert len(cache) == 1
+    cache.get(('as', 'ga'), potcars[1:])
+    # the least recently used entry is evicted beyond max_size
+    assert len(cache) == 1
+    assert cache.size == 2000
+    assert cache.get(('as', 'ga'), []) is not None
@@ -0,0 +1,65 @@
+"""Unittests for the POTCAR header scanner"""
+# pylint: disable=redefined-outer-name
+import hashlib
+import os
+
+import pytest
+
+from aiida_vasp.utils.io.potcar import PawParser, iter_datasets
+
+LDA = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'backendtests', 'LDA')
+
+
+@pytest.fixture()
+def potcars():
+    return [os.path.join(LDA, name, 'POTCAR') for name in ['In_d', 'As']]
+
+
+@pytest.fixture()
+def concatenated(tmpdir, potcars):
+    path = tmpdir.join('POTCAR')
+    path.write(''.join(open(potcar).read() for potcar in potcars))
+    return str(path)
+
+
+def test_iter_datasets(concatenated, potcars):
+    with open(concatenated) as potcar:
+        datasets = list(iter_datasets(potcar))
+    assert [data for _, data in datasets
+            ] == [open(path).read() for path in potcars]
+    header = datasets[0][0]
+    assert 'TITEL' in ''.join(header)
+
+
+def test_iter_datasets_header_end():
+    lines = [
+        ' PAW_PBE X 01Jan2000\n', '   TITEL  = PAW_PBE X 01Jan2000\n',
+        ' END of PSCTR-controll parameters\n', '   ENMAX  = 1.0\n',
+        ' End of Dataset\n', '\n'
+    ]
+    (header, data), = list(iter_datasets(lines))
+    assert header == lines[:2]
+    assert data == ''.join(lines)
+    (header, data), = list(iter_datasets(iter(lines), header_only=True))
+    assert header == lines[:2]
+    assert data is None
+
+
+def test_parse_potcar(potcars):
+    attrs = PawParser.parse_potcar(potcars[1])
+    assert attrs['symbol'] == 'As'
+    assert attrs['element'] == 'As'
+    assert attrs['enmax'] == 123.456
+    assert attrs['valence'] == 5.
+    assert PawParser.parse_potcar(potcars[1], header_only=True) == attrs
+    md5, scanned = PawParser.scan_potcar(potcars[1])
+    assert scanned == attrs
+    assert md5 == hashlib.md5(open(potcars[1], 'rb').read()).hexdigest()
+
+
+def test_parse_concatenated(concatenated):
+    with pytest.raises(ValueError):
+        PawParser.parse_potcar(concatenated)
+    attrs = PawParser.parse_potcars(concatenated)
+    assert [i['symbol'] for i in attrs] == ['In_d', 'As']
@@ -0,0 +1,71 @@
+"""Unittests for the PROCAR parser"""
+# pylint: disable=redefined-outer-name
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.procar import ProcarParser
+
+ORBITALS = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']
+
+
+@pytest.fixture()
+def procar(tmpdir):
+    """A spin polarized PROCAR with 3 kpoints, 4 bands and 2 ions"""
+    projections = numpy.round(
+        numpy.random.RandomState(0).rand(2, 3, 4, 2, 9), 3)
+    lines = ['PROCAR lm decomposed']
+    for spin in range(2):
+        lines += [
+            '# of k-points:  3         # of bands:  4         # of ions:   2',
+            ''
+        ]
+        for kpoint in range(3):
+            lines += [
+                ' k-point {:5d} :    0.00000000-0.50000000 0.25000000     '
+                'weight = 0.33333333'.format(kpoint + 1), ''
+            ]
+            for band in range(4):
+                lines += [
+                    'band {:5d} # energy {:14.8f} # occ. {:12.8f}'.format(
+                        band + 1, band - 5. + spin, 1.), '',
+                    'ion      ' + '    '.join(ORBITALS) + '    tot'
+                ]
+                for ion in range(2):
+                    values = projections[spin, kpoint, band, ion]
+                    lines.append('{:5d}'.format(ion + 1) + ''.join(
+                        '{:7.3f}'.format(value)
+                        for value in list(values) + [values.sum()]))
+                total = projections[spin, kpoint, band].sum(axis=0)
+                lines += [
+                    'tot  ' + ''.join('{:7.3f}'.format(value)
+                                      for value in list(total) +
+                                      [total.sum()]), ''
+                ]
+    path = str(tmpdir.join('PROCAR'))
+    with open(path, 'w') as procar_file:
+        procar_file.write('\n'.join(lines) + '\n')
+    return path, projections
+
+
+def test_parse_procar(procar):
+    path, reference = procar
+    parser = ProcarParser(path)
+    assert parser.header['n_spins'] == 2
+    assert parser.orbitals == ORBITALS
+    assert parser.projections.shape == (2, 3, 4, 2, 9)
+    assert parser.projections.dtype == numpy.float32
+    assert numpy.allclose(parser.projections, reference, atol=1e-6)
+    assert numpy.all(parser.kpoints[0] == [0, -0.5, 0.25])
+    assert numpy.all(parser.energies[1, 0] == [-4, -3, -2, -1])
+
+
+def test_select_ions_orbitals(procar):
+    path, reference = procar
+    parser = ProcarParser(
+        path, ions=[1], orbitals=['px', 0], dtype=numpy.float64)
+    assert parser.projections.shape == (2, 3, 4, 1, 2)
+    assert parser.orbitals == ['px', 's']
+    assert numpy.allclose(parser.projections,
+                          reference[:, :, :, [1]][..., [3, 0]])
+    with pytest.raises(ValueError):
+        ProcarParser(path, orbitals=['f'])
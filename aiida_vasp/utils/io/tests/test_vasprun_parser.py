@@ -0,0 +1,102 @@
+"""Unittests for the vasprun.xml parsers"""
+# pylint: disable=redefined-outer-name
+import os
+
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.vasprun import (VasprunParser, VasprunStreamParser,
+                                         ParseError)
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+@pytest.fixture()
+def vasprun_path():
+    return data_path('phonondb', 'vasprun.xml')
+
+
+def test_stream_parser(vasprun_path):
+    """The streaming parser must give the same results as the tree parser"""
+    tree_parser = VasprunParser(vasprun_path)
+    stream_parser = VasprunStreamParser(vasprun_path)
+    assert stream_parser.efermi == tree_parser.efermi
+    assert stream_parser.is_sc == tree_parser.is_sc
+    assert stream_parser.is_static == tree_parser.is_static
+    assert numpy.all(stream_parser.cell == tree_parser.cell)
+    assert numpy.all(stream_parser.pos == tree_parser.pos)
+    assert numpy.all(stream_parser.bands == tree_parser.bands)
+    assert numpy.all(stream_parser.occupations == tree_parser.occupations)
+    assert numpy.all(stream_parser.tdos == tree_parser.tdos)
+    assert stream_parser.pdos.size == tree_parser.pdos.size
+
+
+def test_stream_parser_ionic_steps(vasprun_path):
+    stream_parser = VasprunStreamParser(vasprun_path)
+    assert len(stream_parser.ionic_steps) == 1
+    step = stream_parser.ionic_steps[0]
+    assert step['forces'].shape == (104, 3)
+    assert numpy.all(step['forces'][0] == numpy.array(
+        [-0.23272115, -0.01115905, 0.03449686]))
+    assert step['stress'].shape == (3, 3)
+    assert step['energy']['e_fr_energy'] == -459.8761413
+
+
+def test_index_lookups(vasprun_path):
+    """Named tags are found through the index, values are cached"""
+    parser = VasprunParser(vasprun_path)
+    assert parser.param('IBRION') == -1
+    assert parser.param('NBANDS') == 452
+    assert parser.param('NONEXISTENT', default=0) == 0
+    assert parser.tag('i', 'efermi') is parser.tree.find(
+        './/i[@name="efermi"]')
+    assert parser.bands is parser.bands
+
+
+@pytest.fixture()
+def md_vasprun_path(vasprun_path, tmpdir):
+    """A vasprun.xml with five copies of the ionic step"""
+    with open(vasprun_path) as vasprun:
+        text = vasprun.read()
+    start = text.index('<calculation>')
+    end = text.index('</calculation>') + len('</calculation>')
+    path = str(tmpdir.join('vasprun.xml'))
+    with open(path, 'w') as md_vasprun:
+        md_vasprun.write(text[:start] + text[start:end] * 5 + text[end:])
+    return path
+
+
+def test_trajectory(md_vasprun_path):
+    stream_parser = VasprunStreamParser(md_vasprun_path, step_stride=2)
+    assert stream_parser.num_steps == 5
+    assert len(stream_parser.symbols) == 104
+    assert stream_parser.symbols[0] == 'P'
+    trajectory = stream_parser.trajectory()
+    assert numpy.all(trajectory['steps'] == [0, 2, 4])
+    assert trajectory['positions'].shape == (3, 104, 3)
+    assert trajectory['forces'].shape == (3, 104, 3)
+    assert trajectory['basis'].shape == (3, 3, 3)
+    assert numpy.all(trajectory['e_fr_energy'] == -459.8761413)
+
+
+def test_salvage(md_vasprun_path):
+    """A truncated file is read up to the last complete ionic step"""
+    with open(md_vasprun_path) as vasprun:
+        text = vasprun.read()
+    cut = text.rindex('<calculation>') + 1000
+    with open(md_vasprun_path, 'w') as vasprun:
+        vasprun.write(text[:cut])
+    with pytest.raises(ParseError):
+        VasprunStreamParser(md_vasprun_path)
+    stream_parser = VasprunStreamParser(md_vasprun_path, salvage=True)
+    assert stream_parser.partial
+    assert stream_parser.num_steps == 4
+    assert stream_parser.cell.shape == (3, 3)
+    assert stream_parser.final_energies['e_fr_energy'] == -459.8761413
@@ -0,0 +1,63 @@
+"""Unittests for the WAVECAR parser"""
+# pylint: disable=redefined-outer-name
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.wavecar import WavecarParser
+
+NUM_PLANE_WAVES = [7, 5, 6]
+
+
+@pytest.fixture()
+def wavecar(tmpdir):
+    """A spin polarized, single precision WAVECAR with 3 kpoints and 2 bands"""
+    random = numpy.random.RandomState(0)
+    record_length = 8 * max(NUM_PLANE_WAVES + [4 + 3 * 2, 12])
+    records = [[record_length, 2, 45200], [3, 2, 400.] + range(1, 10)]
+    coefficients = {}
+    for spin in range(2):
+        for kpoint, num_pw in enumerate(NUM_PLANE_WAVES):
+            records.append(
+                [num_pw, 0.5 * kpoint, 0, 0,
+                 -5. + spin, 0, 1., kpoint + 1., 0, 0.])
+            for band in range(2):
+                values = (random.rand(num_pw) + 1j * random.rand(num_pw))
+                coefficients[spin, kpoint, band] = values.astype(
+                    numpy.complex64)
+                records.append(coefficients[spin, kpoint, band])
+    path = str(tmpdir.join('WAVECAR'))
+    with open(path, 'wb') as wavecar_file:
+        for record in records:
+            data = numpy.asarray(
+                record, dtype=getattr(record, 'dtype', numpy.float64))
+            wavecar_file.write(data.tostring().ljust(record_length, '\0'))
+    return path, coefficients
+
+
+def test_parse_header(wavecar):
+    path, _ = wavecar
+    parser = WavecarParser(path)
+    assert parser.header['n_spins'] == 2
+    assert parser.header['n_kp'] == 3
+    assert parser.header['n_bands'] == 2
+    assert parser.header['encut'] == 400
+    assert parser.header['precision'] == 'complex64'
+    assert numpy.all(parser.header['lattice'][1] == [4, 5, 6])
+    assert parser.complete
+
+
+def test_kpoint_records(wavecar):
+    parser = WavecarParser(wavecar[0])
+    assert numpy.all(parser.num_plane_waves == [NUM_PLANE_WAVES] * 2)
+    assert numpy.all(parser.kpoints[:, 0] == [0, 0.5, 1])
+    assert numpy.all(parser.eigenvalues[1, 2] == [-4, 3])
+    assert numpy.all(parser.occupations[:, :, 0] == 1)
+
+
+def test_coefficients(wavecar):
+    path, coefficients = wavecar
+    parser = WavecarParser(path)
+    for key, reference in coefficients.iteritems():
+        assert numpy.all(parser.coefficients(*key) == reference)
+    with pytest.raises(IndexError):
+        parser.coefficients(0, 3, 0)
@@ -0,0 +1,68 @@
+"""Unittests for the XDATCAR parser"""
+# pylint: disable=redefined-outer-name
+import os
+
+import numpy
+import pytest
+
+from aiida_vasp.utils.io.xdatcar import XdatParser
+
+
+def data_path(*args):
+    """path to a test data file"""
+    path = os.path.realpath(
+        os.path.join(__file__, '../../../../test_data', *args))
+    assert os.path.exists(path)
+    assert os.path.isabs(path)
+    return path
+
+
+@pytest.fixture()
+def xdatcar_lines():
+    with open(data_path('phonondb', 'XDATCAR')) as xdatcar:
+        return xdatcar.readlines()
+
+
+def write_xdatcar(tmpdir, text):
+    path = str(tmpdir.join('XDATCAR'))
+    with open(path, 'w') as xdatcar:
+        xdatcar.write(text)
+    return path
+
+
+def test_parse_xdatcar():
+    parser = XdatParser(data_path('phonondb', 'XDATCAR'))
+    assert parser.num_steps == 1
+    assert not parser.variable_cell
+    assert parser.symbols[:2] == ['P', 'P']
+    assert len(parser.symbols) == 104
+    trajectory = parser.read()
+    assert trajectory['positions'].shape == (1, 104, 3)
+    assert numpy.all(
+        trajectory['positions'][0, 0] == [0.37912578, 0.37152236, 0.75])
+    assert trajectory['cells'][0, 2, 2] == 9.043083
+
+
+def test_stride_and_truncation(xdatcar_lines, tmpdir):
+    """A strided read of a constant cell file with an incomplete last block"""
+    header, block = ''.join(xdatcar_lines[:7]), xdatcar_lines[8:]
+    text = header + ''.join('Direct configuration={:6d}\n'.format(i) +
+                            ''.join(block) for i in range(1, 6))
+    text += 'Direct configuration=     6\n' + ''.join(block[:10])
+    parser = XdatParser(write_xdatcar(tmpdir, text))
+    assert parser.num_steps == 5
+    trajectory = parser.read(1, None, 2)
+    assert numpy.all(trajectory['steps'] == [2, 4])
+    assert trajectory['positions'].shape == (2, 104, 3)
+
+
+def test_variable_cell(xdatcar_lines, tmpdir):
+    header, block = ''.join(xdatcar_lines[:7]), xdatcar_lines[8:]
+    text = ''.join(
+        header.replace('15.428799', '{:9.6f}'.format(15. + i)) +
+        'Direct configuration={:6d}\n'.format(i) + ''.join(block)
+        for i in range(1, 5))
+    parser = XdatParser(write_xdatcar(tmpdir, text))
+    assert parser.variable_cell
+    trajectory = parser.read()
+    assert numpy.all(trajectory['cells'][:, 0, 0] == [16, 17, 18, 19])
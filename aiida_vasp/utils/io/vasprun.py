@@ -4,21 +4,108 @@ Tools for parsing vasprun.xml files
 
 try:
     from lxml.objectify import parse
+    from lxml.etree import iterparse, tostring, XMLSyntaxError as ParseError
+
+    def text_content(elem):
+        """All text inside elem, concatenated in C by lxml"""
+        return tostring(elem, method='text', with_tail=False)
 except ImportError:
-    from xml.etree.ElementTree import parse
+    from xml.etree.ElementTree import parse, iterparse, ParseError
+
+    def text_content(elem):
+        """All text inside elem"""
+        return ''.join(elem.itertext())
 import datetime as dt
+import hashlib
+
 import numpy as np
 
 
+def cached(method):
+    """Cache the result of a parser method per instance and arguments"""
+
+    def cached_method(self, *args, **kwargs):
+        """look up the result in the instance cache, compute it if missing"""
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in self._cache:  # pylint: disable=protected-access
+            self._cache[key] = method(self, *args, **kwargs)  # pylint: disable=protected-access
+        return self._cache[key]  # pylint: disable=protected-access
+
+    cached_method.__name__ = method.__name__
+    cached_method.__doc__ = method.__doc__
+    return cached_method
+
+
+def disk_cached(method):
+    """Look up the array returned by a parser method in the parser's on disk cache entry"""
+
+    def disk_cached_method(self, *args, **kwargs):
+        """load the array from the cache entry, compute and store it if missing"""
+        entry = self._entry  # pylint: disable=protected-access
+        if entry is None:
+            return method(self, *args, **kwargs)
+        name = '{}-{}'.format(method.__name__,
+                              hashlib.md5(
+                                  repr((args, sorted(
+                                      kwargs.items())))).hexdigest())
+        array = entry.get(name)
+        if array is None:
+            array = method(self, *args, **kwargs)
+            if array is not None:
+                entry.put(name, array)
+        return array
+
+    disk_cached_method.__name__ = method.__name__
+    disk_cached_method.__doc__ = method.__doc__
+    return disk_cached_method
+
+
 class VasprunParser(object):
     """
     parse xml into objecttree, provide convenience methods
     for parsing
+
+    Named tags are indexed once on loading by (tag, name, section), where
+    section is the top level element they are found in (the name for
+    <structure> tags, like 'finalpos'), or None for the first occurrence
+    anywhere in the file. Extracted values are cached, the returned arrays
+    are shared between calls and should not be modified in place.
+
+    :param cache: optional :py:class:`~aiida_vasp.utils.io.cache.ArrayCache`,
+        arrays are taken from it if the file was parsed before.
     """
 
-    def __init__(self, fname):
+    CACHE_VERSION = 1
+
+    _SECTIONS = {
+        '//': None,
+        '/parameters//': 'parameters',
+        '//structure[@name="finalpos"]//': 'finalpos'
+    }
+
+    def __init__(self, fname, cache=None):
         super(VasprunParser, self).__init__()
         self.tree = parse(fname)
+        self.partial = False
+        self._cache = {}
+        self._entry = None
+        if cache:
+            self._entry = cache.entry(fname, 'vasprun', self.CACHE_VERSION)
+        self._index = self._build_index(self.tree.getroot())
+
+    @staticmethod
+    def _build_index(root):
+        """Map (tag, name, section) and (tag, name, None) to the first matching element"""
+        index = {}
+        for child in root.findall('*'):
+            section = child.get('name') if child.tag == 'structure' else child.tag
+            for elem in child.iter():
+                name = elem.get('name')
+                if name is None:
+                    continue
+                index.setdefault((elem.tag, name, section), elem)
+                index.setdefault((elem.tag, name, None), elem)
+        return index
 
     @property
     def program(self):
@@ -55,6 +142,17 @@ class VasprunParser(object):
     def efermi(self):
         return self._i('efermi')
 
+    @property
+    def final_energies(self):
+        """The energies of the last ionic step"""
+        calculations = self.root.findall('calculation')
+        if not calculations:
+            return {}
+        energies = calculations[-1].findall('energy')
+        if not energies:
+            return {}
+        return named_values(energies[-1])
+
     @property
     def is_static(self):
         ibrion = self.param('IBRION', default=-1)
@@ -102,96 +200,455 @@ class VasprunParser(object):
     @property
     def pdos(self):
         """The partial DOS array"""
-        try:
-            dos = self._array(parent='dos/partial')
-        except Exception:  # pylint: disable=broad-except
+        dos = self._array(parent='dos/partial')
+        if dos is None:
             dos = np.array([])
         return dos
 
     def param(self, key, default=None):
         path = '/parameters//'
-        return self._i(key, path=path) or self._v(key, path=path) or default
+        value = self._i(key, path=path)
+        if value is None:
+            value = self._v(key, path=path)
+        return default if value is None else value
 
+    @cached
+    @disk_cached
     def _varray(self, key, path='//'):
         """Extract a <varray> tag"""
         tag = self.tag('varray', key, path)
         if tag is None:
             return None
+        return varray_value(tag)
 
-        def split(string_):
-            return string_.text.split()
-
-        return np.array(map(split, tag.v), dtype=float)
-
+    @cached
+    @disk_cached
     def _array(self, parent, key=None, path='//'):
         """extract an <array> tag"""
         pred = '[@name="%s"]' % key if key else ''
         tag = self.tree.find(path + parent + '/array%s' % pred)
-        dims = [i.text for i in tag.findall('dimension')]
-
-        def getdtf(field):
-            d_type = field.attrib.get('type', float)
-            if d_type == 'string':
-                d_type = 'S128'
-            return (field.text.strip(), d_type)
-
-        dtyp = np.dtype([getdtf(f) for f in tag.findall('field')])
-        ndim = len(dims)
-        shape = []
-        subset = tag.find('set')
-        for _ in range(ndim - 1):
-            if subset.find('set') is not None:
-                shape.append(len(subset.findall('set')))
-                subset = subset.find('set')
-        ldim = subset.findall('r')
-        mode = 'r'
-        if not ldim:
-            ldim = subset.findall('rc')
-            mode = 'rc'
-        shape.append(len(ldim))
-
-        def split(string_):
-            if mode == 'r':
-                return tuple(string_.text.split())
-            elif mode == 'rc':
-                return tuple([x.text.strip() for x in string_.c])
-
-        data = np.array(map(split, tag.iterfind('*//%s' % mode)), dtype=dtyp)
-        return data.reshape(shape)
+        if tag is None:
+            return None
+        return array_value(tag)
 
+    @cached
     def _i(self, key, path='//'):
         """Extract an <i> tag"""
         tag = self.tag('i', key, path)
-        res = None
-        if tag is not None:
-            if tag.attrib.get('type') == 'logical':
-                res = 'T' in tag.text
-            elif tag.attrib.get('type') == 'int':
-                res = int(tag.text)
-            elif tag.attrib.get('type') == 'string':
-                res = tag.text.strip()
-            else:
-                try:
-                    res = int(tag.text)
-                except ValueError:
-                    try:
-                        res = float(tag.text)
-                    except ValueError:
-                        res = tag.text.strip()
-        return res
+        if tag is None:
+            return None
+        return i_value(tag)
 
+    @cached
     def _v(self, key, path='//'):
         """Extract an <v> tag"""
         tag = self.tag('v', key, path)
-        if tag is not None:
-            dtype = tag.attrib.get('type', float)
-            return np.array(tag.text.split(), dtype=dtype)
-        return None
+        if tag is None:
+            return None
+        return v_value(tag)
 
     @staticmethod
     def _fppath():
         return '//structure[@name="finalpos"]//'
 
     def tag(self, tag, key, path='//'):
+        """Find a named tag, through the index for the known paths"""
+        if path in self._SECTIONS:
+            return self._index.get((tag, key, self._SECTIONS[path]))
         path = '{p}{t}[@name="{n}"]'.format(p=path, t=tag, n=key)
         return self.tree.find(path)
+
+
+class VasprunStreamParser(object):
+    """
+    parse vasprun.xml incrementally, provide the same convenience
+    properties as :py:class:`VasprunParser`
+
+    Only one top level element (for example one ``<calculation>`` block)
+    is held in memory at any time, processed elements are cleared.
+    Per ionic step data is collected into :py:attr:`ionic_steps`,
+    eigenvalues and DOS are kept from the last ionic step containing them.
+
+    :param sections: the array sections to convert, any of 'eigenvalues' and 'dos'
+        (default: all), others are skipped.
+    :param step_stride: only keep every step_stride-th ionic step, starting with the first
+    :param salvage: if True, a truncated or broken file is read up to the last
+        complete top level element (for example the last finished ionic step)
+        instead of raising, :py:attr:`partial` is set in that case.
+    """
+
+    def __init__(self, fname, sections=None, step_stride=1, salvage=False):
+        super(VasprunStreamParser, self).__init__()
+        if sections is None:
+            sections = ['eigenvalues', 'dos']
+        self.sections = set(sections)
+        self.step_stride = step_stride
+        self.salvage = salvage
+        self.partial = False
+        self.generator = {}
+        self.incar = {}
+        self.parameters = {}
+        self.symbols = []
+        self.finalpos = {}
+        self.ionic_steps = []
+        self.num_steps = 0
+        self._final_energies = {}
+        self._eigenvalues = None
+        self._efermi = None
+        self._tdos = None
+        self._pdos = None
+        self._handlers = {
+            'generator': self._read_generator,
+            'incar': self._read_incar,
+            'parameters': self._read_parameters,
+            'atominfo': self._read_atominfo,
+            'structure': self._read_structure,
+            'calculation': self._read_calculation
+        }
+        self._parse(fname)
+
+    def _parse(self, fname):
+        """Parse the file, in salvage mode stop at the first syntax error"""
+        try:
+            self._iterparse(fname)
+        except ParseError:
+            if not self.salvage:
+                raise
+            self.partial = True
+
+    def _iterparse(self, fname):
+        """Iterate over the file, hand complete top level elements to their handler"""
+        depth = 0
+        root = None
+        for event, elem in iterparse(fname, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            handler = self._handlers.get(elem.tag)
+            if handler:
+                handler(elem)
+            root.remove(elem)
+            elem.clear()
+
+    def _read_generator(self, elem):
+        self.generator.update(named_values(elem, recursive=False))
+
+    def _read_incar(self, elem):
+        self.incar.update(named_values(elem, recursive=False))
+
+    def _read_parameters(self, elem):
+        self.parameters.update(named_values(elem, recursive=True))
+
+    def _read_atominfo(self, elem):
+        atoms = elem.find('array[@name="atoms"]')
+        if atoms is not None:
+            self.symbols = [
+                str(symbol) for symbol in array_value(atoms)['element']
+            ]
+
+    def _read_structure(self, elem):
+        if elem.attrib.get('name') == 'finalpos':
+            self.finalpos = structure_values(elem)
+
+    def _read_calculation(self, elem):
+        """Collect the per ionic step data and keep eigenvalues and dos"""
+        if self.num_steps % self.step_stride == 0:
+            self.ionic_steps.append(self._read_step(elem))
+        self.num_steps += 1
+        energies = elem.findall('energy')
+        if energies:  # also from steps left out by step_stride
+            self._final_energies = named_values(
+                energies[-1], recursive=False)
+
+        eigenvalues = elem.find('eigenvalues/array')
+        if eigenvalues is not None and 'eigenvalues' in self.sections:
+            self._eigenvalues = array_value(eigenvalues)
+        dos = elem.find('dos')
+        if dos is not None:
+            efermi = dos.find('i[@name="efermi"]')
+            if efermi is not None:
+                self._efermi = i_value(efermi)
+            if 'dos' not in self.sections:
+                return
+            total = dos.find('total/array')
+            if total is not None:
+                self._tdos = array_value(total)
+            partial = dos.find('partial/array')
+            if partial is not None:
+                self._pdos = array_value(partial)
+
+    def _read_step(self, elem):
+        """Extract structure, forces, stress and energies of a <calculation> tag"""
+        step = {'index': self.num_steps}
+        structure = elem.find('structure')
+        if structure is not None:
+            step.update(structure_values(structure))
+        for name in ['forces', 'stress']:
+            tag = elem.find('varray[@name="%s"]' % name)
+            if tag is not None:
+                step[name] = varray_value(tag)
+        energies = elem.findall('energy')
+        if energies:
+            step['energy'] = named_values(energies[-1], recursive=False)
+        return step
+
+    def trajectory(self):
+        """
+        The kept ionic steps, stacked into arrays
+
+        :return: dict with 'steps' (the ionic step indices), 'basis' (nsteps, 3, 3),
+            'positions' (nsteps, natoms, 3) in reduced coordinates,
+            'forces' (nsteps, natoms, 3), 'stress' (nsteps, 3, 3) and one
+            (nsteps,) array per energy (like 'e_fr_energy'). Quantities
+            missing in any of the steps are left out.
+        """
+        steps = self.ionic_steps
+        if not steps:
+            return {}
+        arrays = {'steps': np.array([step['index'] for step in steps])}
+        for name in ['basis', 'positions', 'forces', 'stress']:
+            if all(name in step for step in steps):
+                arrays[name] = np.array([step[name] for step in steps])
+        if all('energy' in step for step in steps):
+            for name in steps[0]['energy']:
+                arrays[name] = np.array(
+                    [step['energy'].get(name, np.nan) for step in steps])
+        return arrays
+
+    @property
+    def program(self):
+        return self._i('program')
+
+    @property
+    def version(self):
+        return self._i('version').strip()
+
+    @property
+    def datetime(self):
+        date = self._i('date')
+        time = self._i('time')
+        dtstr = date + ' ' + time
+        return dt.datetime.strptime(dtstr, '%Y %m %d %H:%M:%S')
+
+    @property
+    def cell(self):
+        return self._final_structure.get('basis')
+
+    @property
+    def volume(self):
+        return self._final_structure.get('volume')
+
+    @property
+    def pos(self):
+        return self._final_structure.get('positions')
+
+    @property
+    def _final_structure(self):
+        """The final structure, the last kept ionic step for a partial file"""
+        if self.finalpos or not self.partial or not self.ionic_steps:
+            return self.finalpos
+        return self.ionic_steps[-1]
+
+    @property
+    def efermi(self):
+        return self._efermi
+
+    @property
+    def final_energies(self):
+        """The energies of the last ionic step"""
+        return self._final_energies
+
+    @property
+    def is_static(self):
+        ibrion = self.param('IBRION', default=-1)
+        return ibrion == -1
+
+    @property
+    def is_md(self):
+        ibrion = self.param('IBRION', default=-1)
+        return ibrion not in [-1, 1, 2]
+
+    @property
+    def is_relaxation(self):
+        ibrion = self.param('IBRION', default=-1)
+        return ibrion in [1, 2]
+
+    @property
+    def is_sc(self):
+        icharg = self._i('ICHARG')
+        return icharg < 10
+
+    @property
+    def occupations(self):
+        if self._eigenvalues is None:
+            return None
+        return self._eigenvalues['occ']
+
+    @property
+    def bands(self):
+        if self._eigenvalues is None:
+            return None
+        return self._eigenvalues['eigene']
+
+    @property
+    def tdos(self):
+        return self._tdos
+
+    @property
+    def pdos(self):
+        """The partial DOS array"""
+        if self._pdos is None:
+            return np.array([])
+        return self._pdos
+
+    def param(self, key, default=None):
+        value = self.parameters.get(key)
+        return default if value is None else value
+
+    def _i(self, key):
+        """Look up a scalar in document order: generator, incar, parameters"""
+        for section in [self.generator, self.incar, self.parameters]:
+            if key in section:
+                return section[key]
+        return None
+
+
+def named_values(elem, recursive=False):
+    """
+    Collect the <i> and <v> children of elem into a dict
+
+    :param recursive: also collect from nested elements (like <separator>)
+    """
+    children = elem.iter() if recursive else elem.findall('*')
+    values = {}
+    for child in children:
+        name = child.attrib.get('name')
+        if name is None or name in values or child.text is None:
+            continue
+        if child.tag == 'i':
+            values[name] = i_value(child)
+        elif child.tag == 'v':
+            values[name] = v_value(child)
+    return values
+
+
+def structure_values(elem):
+    """Extract basis, volume and positions from a <structure> tag"""
+    values = {}
+    basis = elem.find('crystal/varray[@name="basis"]')
+    if basis is not None:
+        values['basis'] = varray_value(basis)
+    volume = elem.find('crystal/i[@name="volume"]')
+    if volume is not None:
+        values['volume'] = i_value(volume)
+    positions = elem.find('varray[@name="positions"]')
+    if positions is not None:
+        values['positions'] = varray_value(positions)
+    return values
+
+
+def i_value(tag):
+    """Convert an <i> tag to a python value"""
+    if tag.attrib.get('type') == 'logical':
+        res = 'T' in tag.text
+    elif tag.attrib.get('type') == 'int':
+        res = int(tag.text)
+    elif tag.attrib.get('type') == 'string':
+        res = tag.text.strip()
+    else:
+        try:
+            res = int(tag.text)
+        except ValueError:
+            try:
+                res = float(tag.text)
+            except ValueError:
+                res = tag.text.strip()
+    return res
+
+
+def v_value(tag):
+    """Convert a <v> tag to a numpy array"""
+    dtype = tag.attrib.get('type', float)
+    return np.array(tag.text.split(), dtype=dtype)
+
+
+def varray_value(tag):
+    """Convert a <varray> tag to a 2d numpy array"""
+    rows = tag.findall('v')
+    if rows:
+        ncols = len(rows[0].text.split())
+        data = np.fromstring(text_content(tag), sep=' ')
+        if data.size == len(rows) * ncols:
+            return data.reshape(len(rows), ncols)
+
+    def split(string_):
+        return string_.text.split()
+
+    return np.array(map(split, rows), dtype=float)
+
+
+def array_value(tag):
+    """
+    Convert an <array> tag to a structured numpy array
+
+    Arrays with only float fields are converted in one bulk call,
+    others are converted row by row.
+    """
+    dims = [i.text for i in tag.findall('dimension')]
+
+    def getdtf(field):
+        d_type = field.attrib.get('type', float)
+        if d_type == 'string':
+            d_type = 'S128'
+        return (field.text.strip(), d_type)
+
+    dtyp = np.dtype([getdtf(f) for f in tag.findall('field')])
+    ndim = len(dims)
+    shape = []
+    subset = tag.find('set')
+    for _ in range(ndim - 1):
+        if subset.find('set') is not None:
+            shape.append(len(subset.findall('set')))
+            subset = subset.find('set')
+    ldim = subset.findall('r')
+    mode = 'r'
+    if not ldim:
+        ldim = subset.findall('rc')
+        mode = 'rc'
+    shape.append(len(ldim))
+
+    if mode == 'r' and _is_float_dtype(dtyp):
+        data = _bulk_array(tag, shape, dtyp)
+        if data is not None:
+            return data
+
+    def split(string_):
+        if mode == 'r':
+            return tuple(string_.text.split())
+        elif mode == 'rc':
+            return tuple([x.text.strip() for x in string_.findall('c')])
+
+    data = np.array(map(split, tag.iterfind('*//%s' % mode)), dtype=dtyp)
+    return data.reshape(shape)
+
+
+def _is_float_dtype(dtyp):
+    return all(dtyp.fields[name][0] == np.float64 for name in dtyp.names)
+
+
+def _bulk_array(tag, shape, dtyp):
+    """
+    Convert the concatenated text of the outermost <set> of an <array> tag in one call
+
+    :return: the structured array or None if the text does not hold
+        exactly one float per field and row (for example '****' overflows)
+    """
+    data = np.fromstring(text_content(tag.find('set')), sep=' ')
+    if data.size != np.prod(shape) * len(dtyp.names):
+        return None
+    return data.view(dtyp).reshape(shape)
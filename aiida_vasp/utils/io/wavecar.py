@@ -0,0 +1,143 @@
+"""
+Tools for reading WAVECAR files
+"""
+import os
+
+import numpy as np
+
+from .parser import BaseParser
+
+
+class WavecarParser(BaseParser):
+    """
+    Index the records of a binary WAVECAR file
+
+    A WAVECAR consists of fixed length records: the header (record length, number of spins,
+    precision tag), the cell (number of kpoints and bands, cutoff, lattice vectors) and then
+    for each spin and kpoint a record with the number of plane waves, the kpoint coordinates,
+    eigenvalues and occupations, followed by one record of plane wave coefficients per band.
+
+    Only the two header records are read on creation. The kpoint records are read on first use
+    (a few bytes each) and the coefficients of a band are memory mapped on request, so even a
+    multi-GB file is never read as a whole.
+    """
+
+    PRECISION = {
+        45200: np.complex64,
+        45210: np.complex128,
+        53300: np.complex64,
+        53310: np.complex128
+    }
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = self.read_header(filename)
+        self._kpoint_records = None
+
+    @classmethod
+    def read_header(cls, filename):
+        """
+        Read the first two records
+
+        :return: dict with 'record_length', 'n_spins', 'precision', 'n_kp', 'n_bands',
+            'encut' and 'lattice' (3, 3)
+        """
+        with open(filename, 'rb') as wavecar:
+            values = np.fromfile(wavecar, dtype=np.float64, count=3)
+            if values.size < 3:
+                raise ValueError('not a WAVECAR file')
+            record_length, num_spins, tag = map(int, values)
+            if tag not in cls.PRECISION or record_length <= 0:
+                raise ValueError(
+                    'unsupported WAVECAR precision tag: {}'.format(tag))
+            wavecar.seek(record_length)
+            values = np.fromfile(wavecar, dtype=np.float64, count=12)
+            if values.size < 12:
+                raise ValueError('WAVECAR ends inside the header')
+        return {
+            'record_length': record_length,
+            'n_spins': num_spins,
+            'precision': np.dtype(cls.PRECISION[tag]).name,
+            'n_kp': int(values[0]),
+            'n_bands': int(values[1]),
+            'encut': values[2],
+            'lattice': values[3:12].reshape(3, 3)
+        }
+
+    @property
+    def num_records(self):
+        header = self.header
+        return 2 + header['n_spins'] * header['n_kp'] * (
+            header['n_bands'] + 1)
+
+    @property
+    def complete(self):
+        """Whether the file holds all the records announced in the header"""
+        return os.path.getsize(
+            self.filename) >= self.num_records * self.header['record_length']
+
+    def record_offset(self, spin, kpoint, band=None):
+        """
+        Byte offset of the kpoint record (band=None) or of the coefficient record of a band
+        """
+        header = self.header
+        for name, index, size in [('spin', spin, header['n_spins']),
+                                  ('kpoint', kpoint, header['n_kp']),
+                                  ('band', band, header['n_bands'])]:
+            if index is not None and not 0 <= index < size:
+                raise IndexError('{} index {} out of range (0, {})'.format(
+                    name, index, size))
+        record = 2 + (spin * header['n_kp'] + kpoint) * (header['n_bands'] + 1)
+        if band is not None:
+            record += band + 1
+        return record * header['record_length']
+
+    @property
+    def kpoint_records(self):
+        """(nspin, nkp, 4 + 3 * nbands) array of the kpoint records, read on first use"""
+        if self._kpoint_records is None:
+            header = self.header
+            size = 4 + 3 * header['n_bands']
+            records = np.empty((header['n_spins'], header['n_kp'], size))
+            with open(self.filename, 'rb') as wavecar:
+                for spin in range(header['n_spins']):
+                    for kpoint in range(header['n_kp']):
+                        wavecar.seek(self.record_offset(spin, kpoint))
+                        values = np.fromfile(
+                            wavecar, dtype=np.float64, count=size)
+                        if values.size < size:
+                            raise ValueError(
+                                'WAVECAR ends before kpoint {} of spin {}'.
+                                format(kpoint, spin))
+                        records[spin, kpoint] = values
+            self._kpoint_records = records
+        return self._kpoint_records
+
+    @property
+    def num_plane_waves(self):
+        """(nspin, nkp) number of plane wave coefficients per band"""
+        return self.kpoint_records[:, :, 0].astype(int)
+
+    @property
+    def kpoints(self):
+        """(nkp, 3) kpoint coordinates (reciprocal lattice units)"""
+        return self.kpoint_records[0, :, 1:4]
+
+    @property
+    def eigenvalues(self):
+        """(nspin, nkp, nbands) eigenvalues in eV"""
+        return self.kpoint_records[:, :, 4::3]
+
+    @property
+    def occupations(self):
+        """(nspin, nkp, nbands)"""
+        return self.kpoint_records[:, :, 6::3]
+
+    def coefficients(self, spin, kpoint, band):
+        """Memory map (read only) the plane wave coefficients of a band"""
+        return np.memmap(
+            self.filename,
+            dtype=self.header['precision'],
+            mode='r',
+            offset=self.record_offset(spin, kpoint, band),
+            shape=(self.num_plane_waves[spin, kpoint], ))
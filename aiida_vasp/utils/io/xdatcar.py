@@ -0,0 +1,165 @@
+"""
+Tools for reading MD trajectories from XDATCAR files
+"""
+import mmap
+
+import numpy as np
+
+from .parser import BaseParser
+
+
+class XdatParser(BaseParser):
+    """
+    Read the configurations of a (VASP 5 format) XDATCAR file
+
+    The file is scanned once for the byte offsets of the configuration blocks,
+    any range of configurations is then read by converting each block in one call
+    into a preallocated (nsteps, natoms, 3) array. Both constant cell files
+    (one header) and variable cell files (a header before every configuration)
+    are supported. An incomplete last block (from an interrupted run) is left out.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as xdat:
+            data = mmap.mmap(xdat.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.header = self.read_header(data, 0)
+                self.steps, self.blocks, self.headers = self.index_blocks(
+                    data, self.header['num_atoms'])
+            finally:
+                data.close()
+
+    @property
+    def num_steps(self):
+        return len(self.blocks)
+
+    @property
+    def variable_cell(self):
+        return self.headers is not None
+
+    @property
+    def symbols(self):
+        """The chemical symbol of each atom"""
+        return [
+            symbol
+            for symbol, count in zip(self.header['species'],
+                                     self.header['counts'])
+            for _ in range(count)
+        ]
+
+    @classmethod
+    def read_header(cls, data, pos):
+        """
+        Read a header (comment, scale, lattice vectors, species, counts) starting at pos
+
+        :return: dict with 'name', 'cell' (3, 3) (scaled), 'species', 'counts', 'num_atoms'
+        """
+        data.seek(pos)
+        name = data.readline().strip()
+        scale = cls.line(data, float)
+        cell = np.array([cls.line(data, float) for _ in range(3)])
+        species = data.readline().split()
+        if not species or species[0][0].isdigit():
+            raise ValueError('only the VASP 5 XDATCAR format, '
+                             'with a species line, is supported')
+        counts = cls.line(data, int)
+        if isinstance(counts, int):
+            counts = [counts]
+        return {
+            'name': name,
+            'cell': scale_cell(cell, scale),
+            'species': species,
+            'counts': counts,
+            'num_atoms': sum(counts)
+        }
+
+    @staticmethod
+    def index_blocks(data, num_atoms):
+        """
+        Find the coordinate blocks
+
+        :return: steps (configuration numbers), blocks ((start, end) byte offsets of the
+            coordinate lines) and headers (start offsets of the header before each
+            configuration, None for constant cell files)
+        """
+        marker = b' configuration='
+        steps, blocks, headers = [], [], []
+        row_length = None
+        pos = data.find(marker)
+        while pos != -1:
+            start = data.find(b'\n', pos) + 1
+            if not start:
+                break
+            if row_length is None:
+                row_length = data.find(b'\n', start) + 1 - start
+            end = start + num_atoms * row_length
+            if end > len(data) or data[end - 1:end] != b'\n':
+                end = find_line_end(data, start, num_atoms)
+            if end == -1:  # incomplete block
+                break
+            steps.append(int(data[pos + len(marker):start]))
+            blocks.append((start, end))
+            headers.append(find_line_start(data, pos, 7))
+            pos = data.find(marker, end)
+        # a constant cell file has no header between the blocks
+        if len(blocks) < 2 or headers[1] < blocks[0][1]:
+            headers = None
+        return np.array(steps, dtype=int), blocks, headers
+
+    def read(self, start=0, stop=None, step=1):
+        """
+        Read a range of configurations
+
+        :return: dict with 'steps' (nsteps,) configuration numbers, 'positions'
+            (nsteps, natoms, 3) reduced coordinates and 'cells' (nsteps, 3, 3)
+        """
+        selection = range(*slice(start, stop, step).indices(self.num_steps))
+        num_atoms = self.header['num_atoms']
+        positions = np.empty((len(selection), num_atoms, 3))
+        cells = np.empty((len(selection), 3, 3))
+        with open(self.filename, 'rb') as xdat:
+            data = mmap.mmap(xdat.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for i, block in enumerate(selection):
+                    begin, end = self.blocks[block]
+                    positions[i] = np.fromstring(
+                        data[begin:end], sep=' ').reshape(num_atoms, 3)
+                    if self.variable_cell:
+                        cells[i] = self.read_header(
+                            data, self.headers[block])['cell']
+            finally:
+                data.close()
+        if not self.variable_cell:
+            cells[:] = self.header['cell']
+        return {
+            'steps': self.steps[selection],
+            'positions': positions,
+            'cells': cells
+        }
+
+
+def scale_cell(cell, scale):
+    """Apply the POSCAR style scale factor, a negative one being the volume"""
+    if scale < 0:
+        scale = (-scale / abs(np.linalg.det(cell)))**(1. / 3)
+    return cell * scale
+
+
+def find_line_end(data, start, num_lines):
+    """Offset after the num_lines-th newline from start, -1 if the file ends before"""
+    pos = start
+    for _ in range(num_lines):
+        pos = data.find(b'\n', pos) + 1
+        if not pos:
+            return -1
+    return pos
+
+
+def find_line_start(data, pos, num_lines):
+    """Offset of the start of the line num_lines lines before the one containing pos"""
+    for _ in range(num_lines + 1):
+        pos = data.rfind(b'\n', 0, pos)
+        if pos == -1:
+            return 0
+    return pos + 1
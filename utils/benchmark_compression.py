@@ -0,0 +1,115 @@
+"""
+Benchmark compressed storage of CHGCAR and WAVECAR files
+
+Streams synthetic CHGCAR (text grid of a smooth density) and WAVECAR (random single
+precision coefficients) files through the codecs of aiida_vasp.utils.io.compression,
+as used by the ChargedensityData and WavefunData nodes, and reports the
+compression ratio and the compression and decompression throughput.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from aiida_vasp.utils.io.compression import (CODECS, compress_file,
+                                             decompress_file)
+
+
+def get_parser():
+    """Create a cmdline parser for the tool"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark compressed CHGCAR / WAVECAR storage')
+    parser.add_argument(
+        '--grid', type=int, default=160, help='CHGCAR grid points per axis')
+    parser.add_argument(
+        '--wavecar-mb', type=int, default=64, help='WAVECAR size in MB')
+    parser.add_argument(
+        '--levels',
+        type=int,
+        nargs='+',
+        default=[1, 6, 9],
+        help='compression levels')
+    return parser
+
+
+def write_chgcar(path, num_points):
+    """Write a CHGCAR with a sum of gaussians on a num_points**3 grid"""
+    axis = np.linspace(0, 1, num_points, endpoint=False)
+    with open(path, 'w') as out:
+        out.write('synthetic\n   1.0\n')
+        out.write('    5.65    0.00    0.00\n    0.00    5.65    0.00\n'
+                  '    0.00    0.00    5.65\n   Ga   As\n     1     1\n')
+        out.write('Direct\n  0.00  0.00  0.00\n  0.25  0.25  0.25\n\n')
+        out.write('{0:5d}{0:5d}{0:5d}\n'.format(num_points))
+        xgrid, ygrid = np.meshgrid(axis, axis, indexing='ij')
+        # one z plane at a time, x running fastest as in the file
+        for zval in axis:
+            plane = np.zeros((num_points, num_points))
+            for center in [0., 0.25]:
+                dist = ((xgrid - center)**2 + (ygrid - center)**2 +
+                        (zval - center)**2)
+                plane += 80. * np.exp(-dist / 0.01)
+            plane += 0.5 + np.random.rand(num_points, num_points) * 1e-3
+            values = plane.reshape(-1, order='F')
+            full = values.size // 5 * 5
+            np.savetxt(
+                out,
+                values[:full].reshape(-1, 5),
+                fmt=' %17.11E',
+                delimiter='')
+            if full < values.size:
+                out.write(''.join(' {:17.11E}'.format(value)
+                                  for value in values[full:]) + '\n')
+
+
+def write_wavecar(path, size_mb):
+    """Write a WAVECAR sized file of random single precision coefficients"""
+    with open(path, 'wb') as out:
+        for _ in range(size_mb):
+            block = np.random.rand(2**18).astype(np.float32) - 0.5
+            out.write(block.tostring())
+
+
+def benchmark(path, compression, level):
+    """Compress and decompress path in a stream, return (ratio, MB/s in, MB/s out)"""
+    size = os.path.getsize(path)
+    compressed = path + CODECS[compression][1]
+    start = time.time()
+    compress_file(path, compressed, compression, level)
+    compress_time = time.time() - start
+    start = time.time()
+    decompress_file(compressed, os.devnull, compression)
+    decompress_time = time.time() - start
+    ratio = float(size) / os.path.getsize(compressed)
+    os.remove(compressed)
+    return ratio, size / 1e6 / compress_time, size / 1e6 / decompress_time
+
+
+def main():
+    """Run the benchmarks"""
+    args = get_parser().parse_args()
+    folder = tempfile.mkdtemp()
+    try:
+        files = [('CHGCAR', os.path.join(folder, 'CHGCAR')),
+                 ('WAVECAR', os.path.join(folder, 'WAVECAR'))]
+        write_chgcar(files[0][1], args.grid)
+        write_wavecar(files[1][1], args.wavecar_mb)
+        for name, path in files:
+            print '{} ({:.0f} MB)'.format(name, os.path.getsize(path) / 1e6)
+            for compression in sorted(CODECS):
+                for level in args.levels:
+                    ratio, compress, decompress = benchmark(
+                        path, compression, level)
+                    print('  {:<5} level {}  ratio: {:5.2f}  compress: '
+                          '{:7.1f} MB/s  decompress: {:7.1f} MB/s').format(
+                              compression, level, ratio, compress, decompress)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
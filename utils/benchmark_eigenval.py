@@ -0,0 +1,97 @@
+"""
+Benchmark EIGENVAL parsing
+
+Compares the bulk conversion in aiida_vasp.utils.io.eigenval with the
+previous line by line implementation on a synthetic spin polarized file.
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import timeit
+
+import numpy as np
+
+from aiida_vasp.utils.io.eigenval import EigParser
+
+
+def get_parser():
+    """Create a cmdline parser for the tool"""
+    parser = argparse.ArgumentParser(description='Benchmark EIGENVAL parsing')
+    parser.add_argument(
+        '--kpoints', type=int, default=2000, help='number of kpoints')
+    parser.add_argument(
+        '--bands', type=int, default=200, help='number of bands')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='timing repetitions')
+    return parser
+
+
+def legacy_parse_eigenval(filename):
+    """Line by line EIGENVAL parsing (previous implementation)"""
+    with open(filename) as eig:
+        num_spins = int(eig.readline().split()[3])
+        for _ in range(4):
+            eig.readline()
+        _, num_kp, num_bands = [int(i) for i in eig.readline().split()]
+        data = eig.read()
+    data = re.split(EigParser.empty_line, data)
+    data = [[line.split() for line in block.splitlines()] for block in data]
+    kpoints = np.zeros((num_kp, 4))
+    bands = np.zeros((num_spins, num_kp, num_bands))
+    for k, field in enumerate(data):
+        kpbs = [line for line in field if line]
+        kpoints[k] = [float(i) for i in kpbs.pop(0)]
+        for point in kpbs:
+            bands[:, k, int(point[0]) - 1] = point[1:num_spins + 1]
+    return kpoints, bands
+
+
+def write_synthetic(path, num_kp, num_bands):
+    """Write a spin polarized EIGENVAL file with occupations"""
+    with open(path, 'w') as out:
+        out.write('    8    8    1    2\n')
+        out.write('  0.2779555E+02  0.6058360E-09  0.6058360E-09  '
+                  '0.6058360E-09  0.5000000E-15\n')
+        out.write('  1.000000000000000E-004\n  CAR \n unknown system\n')
+        out.write('  {:5d}  {:5d}  {:5d}\n'.format(16, num_kp, num_bands))
+        for k in range(num_kp):
+            out.write('\n  {:.7E}  {:.7E}  {:.7E}  {:.7E}\n'.format(
+                0.1, 0.2, k * 1e-3, 1. / num_kp))
+            for band in range(num_bands):
+                energy = -10. + 20. * band / num_bands
+                out.write('  {:5d}  {:12.6f}  {:12.6f}  {:9.6f}  {:9.6f}\n'.
+                          format(band + 1, energy, energy + 0.1, 1., 1.))
+
+
+def main():
+    """Run the benchmark"""
+    args = get_parser().parse_args()
+    _, synthetic = tempfile.mkstemp()
+    try:
+        write_synthetic(synthetic, args.kpoints, args.bands)
+        _, kpoints, bands = EigParser.parse_eigenval(synthetic)
+        ref_kpoints, ref_bands = legacy_parse_eigenval(synthetic)
+        assert np.all(kpoints == ref_kpoints)
+        assert np.all(bands == ref_bands)
+        new = min(
+            timeit.repeat(
+                lambda: EigParser.parse_eigenval(synthetic),
+                number=1,
+                repeat=args.repeat))
+        old = min(
+            timeit.repeat(
+                lambda: legacy_parse_eigenval(synthetic),
+                number=1,
+                repeat=args.repeat))
+        print 'EIGENVAL {} kpoints x {} bands x 2 spins'.format(
+            args.kpoints, args.bands)
+        print 'line by line: {:8.4f}s  bulk: {:8.4f}s  speedup: {:6.1f}x'.format(
+            old, new, old / new)
+    finally:
+        os.remove(synthetic)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark POTCAR assembly
+
+Compares concatenating the paw files with a cat subprocess (previous implementation),
+in process, and through the PotcarCache used by VaspCalculation.write_potcar, for a
+number of submissions over the same element combination.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import timeit
+
+from aiida_vasp.utils.io.potcar import PotcarCache, concatenate_potcars
+
+
+def get_parser():
+    """Create a cmdline parser for the tool"""
+    parser = argparse.ArgumentParser(description='Benchmark POTCAR assembly')
+    parser.add_argument(
+        '--elements', type=int, default=3, help='paw files per POTCAR')
+    parser.add_argument(
+        '--size', type=int, default=300, help='size of a paw file in kB')
+    parser.add_argument(
+        '--submissions', type=int, default=500, help='POTCARs to write')
+    return parser
+
+
+def write_paws(folder, elements, size):
+    """Write synthetic paw files"""
+    paths = []
+    for i in range(elements):
+        path = os.path.join(folder, 'POTCAR_{}'.format(i))
+        with open(path, 'w') as paw:
+            paw.write(('  0.12345678E+01' * 5 + '\n') * (size * 1024 / 81))
+        paths.append(path)
+    return paths
+
+
+def legacy_write(paths, dst):
+    """Concatenate with a cat subprocess (previous implementation)"""
+    with open(dst, 'w') as potcar:
+        subprocess.check_call(['cat'] + paths, stdout=potcar)
+
+
+def stream_write(paths, dst):
+    with open(dst, 'wb') as potcar:
+        concatenate_potcars(paths, potcar)
+
+
+def cached_write(cache, key, paths, dst):
+    with open(dst, 'wb') as potcar:
+        potcar.write(cache.get(key, paths))
+
+
+def main():
+    """Run the benchmark"""
+    args = get_parser().parse_args()
+    folder = tempfile.mkdtemp()
+    try:
+        paths = write_paws(folder, args.elements, args.size)
+        dst = os.path.join(folder, 'POTCAR')
+        cache = PotcarCache()
+        key = tuple(paths)
+        timings = [
+            ('cat subprocess', lambda: legacy_write(paths, dst)),
+            ('in process', lambda: stream_write(paths, dst)),
+            ('cached', lambda: cached_write(cache, key, paths, dst)),
+        ]
+        print '{} submissions, {} paw files of {} kB'.format(
+            args.submissions, args.elements, args.size)
+        for label, function in timings:
+            total = timeit.timeit(function, number=args.submissions)
+            print '{:<16} {:8.3f} ms per calculation'.format(
+                label, 1e3 * total / args.submissions)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark the <array> / <varray> conversion of vasprun.xml files
+
+Compares the bulk conversion in aiida_vasp.utils.io.vasprun with the
+previous row by row implementation, on the phonondb test file and on a
+synthetic file with a scaled up projected eigenvalues array.
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import numpy as np
+
+from aiida_vasp.utils.io.vasprun import VasprunParser, array_value, varray_value
+
+TEST_DATA = os.path.join(
+    os.path.dirname(__file__), '..', 'aiida_vasp', 'test_data', 'phonondb',
+    'vasprun.xml')
+
+
+def get_parser():
+    """Create a cmdline parser for the tool"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark vasprun.xml array conversion')
+    parser.add_argument(
+        '--ions', type=int, default=20, help='ions in the synthetic file')
+    parser.add_argument(
+        '--bands', type=int, default=100, help='bands in the synthetic file')
+    parser.add_argument(
+        '--kpoints',
+        type=int,
+        default=40,
+        help='kpoints in the synthetic file')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='timing repetitions')
+    return parser
+
+
+def legacy_varray(tag):
+    """Row by row <varray> conversion (previous implementation)"""
+    return np.array([v.text.split() for v in tag.findall('v')], dtype=float)
+
+
+def legacy_array(tag):
+    """Row by row <array> conversion (previous implementation)"""
+    dims = [i.text for i in tag.findall('dimension')]
+    dtyp = np.dtype([(f.text.strip(), f.attrib.get('type', float))
+                     for f in tag.findall('field')])
+    shape = []
+    subset = tag.find('set')
+    for _ in range(len(dims) - 1):
+        if subset.find('set') is not None:
+            shape.append(len(subset.findall('set')))
+            subset = subset.find('set')
+    shape.append(len(subset.findall('r')))
+    data = np.array(
+        [tuple(r.text.split()) for r in tag.iterfind('*//r')], dtype=dtyp)
+    return data.reshape(shape)
+
+
+def write_synthetic(path, ions, bands, kpoints):
+    """Write a vasprun.xml fragment with a projected eigenvalue array"""
+    fields = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']
+    row = '<r>' + ' '.join(['%.4f' % 0.1234] * len(fields)) + ' </r>\n'
+    with open(path, 'w') as out:
+        out.write('<modeling>\n <calculation>\n  <projected>\n   <array>\n')
+        for dim in ['orbital', 'ion', 'band', 'kpoint', 'spin']:
+            out.write('    <dimension>%s</dimension>\n' % dim)
+        for field in fields:
+            out.write('    <field>%s</field>\n' % field)
+        out.write('    <set>\n     <set comment="spin 1">\n')
+        for _ in range(kpoints):
+            out.write('      <set>\n')
+            for _ in range(bands):
+                out.write('       <set>\n')
+                out.write(row * ions)
+                out.write('       </set>\n')
+            out.write('      </set>\n')
+        out.write('     </set>\n    </set>\n')
+        out.write('   </array>\n  </projected>\n </calculation>\n</modeling>\n')
+
+
+def compare(label, new_fn, old_fn, tag, repeat):
+    """Time both conversions of tag, check they agree and print the result"""
+    assert np.all(new_fn(tag) == old_fn(tag))
+    new = min(timeit.repeat(lambda: new_fn(tag), number=1, repeat=repeat))
+    old = min(timeit.repeat(lambda: old_fn(tag), number=1, repeat=repeat))
+    print '{:<40} row by row: {:8.4f}s  bulk: {:8.4f}s  speedup: {:6.1f}x'.format(
+        label, old, new, old / new)
+
+
+def main():
+    """Run the benchmarks"""
+    args = get_parser().parse_args()
+    vrp = VasprunParser(TEST_DATA)
+    root = vrp.root
+    compare('phonondb eigenvalues', array_value, legacy_array,
+            root.find('.//calculation/eigenvalues/array'), args.repeat)
+    compare('phonondb total dos', array_value, legacy_array,
+            root.find('.//dos/total/array'), args.repeat)
+    compare('phonondb positions', varray_value, legacy_varray,
+            root.find('.//structure[@name="finalpos"]//varray[@name="positions"]'),
+            args.repeat)
+
+    _, synthetic = tempfile.mkstemp(suffix='.xml')
+    try:
+        write_synthetic(synthetic, args.ions, args.bands, args.kpoints)
+        tag = VasprunParser(synthetic).root.find('.//projected/array')
+        label = 'synthetic projected ({}x{}x{})'.format(
+            args.kpoints, args.bands, args.ions)
+        compare(label, array_value, legacy_array, tag, args.repeat)
+    finally:
+        os.remove(synthetic)
+
+
+if __name__ == '__main__':
+    main()